@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
 
@@ -46,7 +47,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,13 +82,25 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Each process borrows connections from a pool of DB_POOL_SIZE, see
+# core.db, 0 opens a connection per request instead
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db' if DB_POOL_SIZE
+                  else 'django.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'POOL': {
+            'SIZE': DB_POOL_SIZE,
+            # Seconds to wait for a free connection
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            # Idle seconds after which a connection is pinged when borrowed
+            'CHECK_AFTER': float(os.environ.get('DB_POOL_CHECK_AFTER', 5)),
+        },
 
         # 'ENGINE': 'django.db.backends.sqlite3',
         # 'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
@@ -93,6 +108,27 @@ DATABASES = {
 }
 
 
+# /healthz answers 503 when a database round trip takes longer
+HEALTHZ_MAX_DB_LATENCY_MS = float(
+    os.environ.get('HEALTHZ_MAX_DB_LATENCY_MS', 250)
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# The local memory default is per process, with several worker processes
+# use a shared cache, e.g. memcached as docker-compose.yml does.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'recipe-app'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -135,4 +171,64 @@ MEDIA_URL = '/media/'
 STATIC_ROOT = '/vol/web/static'
 MEDIA_ROOT = '/vol/web/media'
 
+# How core.views.serve_media hands uploads to the front web server:
+# 'nginx' with X-Accel-Redirect to an internal location aliasing
+# MEDIA_ROOT, e.g.
+#     location /protected-media/ { internal; alias /vol/web/media/; }
+# 'apache' with X-Sendfile (mod_xsendfile), or empty to send them from
+# Python, which is fine for development.
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_SENDFILE_PREFIX = os.environ.get('MEDIA_SENDFILE_PREFIX',
+                                       '/protected-media/')
+
 AUTH_USER_MODEL = "core.User"
+
+# Token lookups are cached for this many seconds in the given cache, which
+# must be shared by the worker processes. A local memory cache is only
+# used when AUTH_TOKEN_CACHE_LOCAL says there is a single process.
+AUTH_TOKEN_CACHE_ALIAS = 'default'
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.environ.get('AUTH_TOKEN_CACHE_TIMEOUT', 60))
+AUTH_TOKEN_CACHE_LOCAL = bool(int(os.environ.get('AUTH_TOKEN_CACHE_LOCAL', 0)))
+
+# Threads resizing uploaded recipe images, 0 resizes them in the request
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+
+# Uploads are hashed as they stream in, for content addressed storage
+FILE_UPLOAD_HANDLERS = [
+    'core.uploadhandler.HashingMemoryFileUploadHandler',
+    'core.uploadhandler.HashingTemporaryFileUploadHandler',
+]
+
+# Responses and request bodies are JSON or MessagePack, chosen by the
+# Accept and Content-Type headers
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'core.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.ORJSONParser',
+        'core.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
+
+# Responses of these types are compressed by core.middleware from this
+# many bytes, smaller ones gain too little for the CPU spent. HTML pages,
+# the admin and browsable API, carry CSRF tokens and are left alone.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_CONTENT_TYPES = (
+    'application/json',
+    'application/msgpack',
+    'application/x-ndjson',
+    'text/csv',
+    'text/plain',
+)
+
+# Fraction of requests core.middleware.ServerTimingMiddleware reports
+# SQL, serializer and view timings of, 0 disables it
+SERVER_TIMING_SAMPLE_RATE = float(
+    os.environ.get('SERVER_TIMING_SAMPLE_RATE', 0)
+)
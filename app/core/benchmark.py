@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+
+ANALYZE_TABLES = ('core_user', 'core_tag', 'core_ingredient', 'core_recipe',
+                  'core_recipe_tags', 'core_recipe_ingredients')
+
+SEED_SQL = (
+    """
+    INSERT INTO core_user (password, last_login, is_superuser, email, name,
+                           is_active, is_staff)
+    SELECT '!', NULL, false, 'seed-' || (%(first_user)s + u) || '@example.com',
+           'Seed user ' || (%(first_user)s + u), true, false
+    FROM generate_series(1, %(users)s) u
+    ORDER BY u
+    """,
+    """
+    INSERT INTO core_tag (name, user_id)
+    SELECT 'Tag ' || t, u.id
+    FROM core_user u CROSS JOIN generate_series(1, %(tags)s) t
+    WHERE u.id > %(first_user)s
+    ORDER BY u.id, t
+    """,
+    """
+    INSERT INTO core_ingredient (name, user_id)
+    SELECT 'Ingredient ' || i, u.id
+    FROM core_user u CROSS JOIN generate_series(1, %(ingredients)s) i
+    WHERE u.id > %(first_user)s
+    ORDER BY u.id, i
+    """,
+    """
+    INSERT INTO core_recipe (user_id, title, time_minutes, price, link)
+    SELECT u.id, 'Recipe ' || r, 5 + r %% 120, (r %% 50) + 0.99, ''
+    FROM core_user u CROSS JOIN generate_series(1, %(recipes)s) r
+    WHERE u.id > %(first_user)s
+    ORDER BY u.id, r
+    """,
+    # Tags and ingredients were inserted in per-user id runs, so each
+    # recipe is linked to a rotating window of its owner's rows.
+    """
+    INSERT INTO core_recipe_tags (recipe_id, tag_id)
+    SELECT r.id, f.first_id + (r.id + k) %% %(tags)s
+    FROM core_recipe r
+    JOIN (SELECT user_id, min(id) AS first_id FROM core_tag
+          WHERE user_id > %(first_user)s GROUP BY user_id) f
+      ON f.user_id = r.user_id
+    CROSS JOIN generate_series(0, %(tag_links)s - 1) k
+    """,
+    """
+    INSERT INTO core_recipe_ingredients (recipe_id, ingredient_id)
+    SELECT r.id, f.first_id + (r.id + k) %% %(ingredients)s
+    FROM core_recipe r
+    JOIN (SELECT user_id, min(id) AS first_id FROM core_ingredient
+          WHERE user_id > %(first_user)s GROUP BY user_id) f
+      ON f.user_id = r.user_id
+    CROSS JOIN generate_series(0, %(ingredient_links)s - 1) k
+    """,
+)
+
+
+def seed_dataset(users, recipes, tags, ingredients, links):
+    """Bulk insert users with tags, ingredients and linked recipes in SQL
+
+    Returns the ids of the users created. Their passwords are unusable,
+    they are meant to authenticate with tokens.
+    """
+    first_user = get_user_model().objects.order_by('-id') \
+        .values_list('id', flat=True).first() or 0
+    params = {
+        'first_user': first_user,
+        'users': users,
+        'recipes': recipes,
+        'tags': tags,
+        'ingredients': ingredients,
+        'tag_links': min(links, tags),
+        'ingredient_links': min(links, ingredients),
+    }
+    with connection.cursor() as cursor:
+        for sql in SEED_SQL:
+            cursor.execute(sql, params)
+    return list(get_user_model().objects.filter(id__gt=first_user)
+                .order_by('id').values_list('id', flat=True))
+
+
+def percentile(values, fraction):
+    """Return the value below which the fraction of sorted values falls"""
+    return values[min(int(len(values) * fraction), len(values) - 1)]
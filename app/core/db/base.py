@@ -0,0 +1,43 @@
+from django.db.backends.postgresql import base
+from core.db.creation import DatabaseCreation
+from core.db.pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL backend borrowing connections from a ConnectionPool
+
+    Closing the connection, as Django does at the end of every request
+    with CONN_MAX_AGE 0, returns it to the pool instead. The POOL entry
+    of the database settings holds the pool's SIZE, its TIMEOUT and the
+    idle seconds after which a connection is checked, CHECK_AFTER.
+    """
+    creation_class = DatabaseCreation
+    pool_defaults = {'SIZE': 10, 'TIMEOUT': 10, 'CHECK_AFTER': 5}
+
+    def get_pool(self, conn_params):
+        options = {**self.pool_defaults, **self.settings_dict.get('POOL', {})}
+        return get_pool(
+            repr(sorted(conn_params.items())),
+            lambda: base.Database.connect(**conn_params),
+            options['SIZE'], options['TIMEOUT'], options['CHECK_AFTER']
+        )
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        connection = self.pool.get()
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                # Django keeps the connection of a transaction it closed
+                # until the transaction ends, so that one can't be reused
+                self.pool.put(self.connection, close=self.in_atomic_block)
@@ -0,0 +1,11 @@
+from django.db.backends.postgresql import creation
+from core.db.pool import close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections to the test database would keep it
+        # from being dropped
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,138 @@
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+import psycopg2
+from psycopg2 import extensions
+
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = None
+
+
+class ConnectionPool:
+    """A process wide pool of at most size psycopg2 connections
+
+    Idle connections are reused newest first, so the oldest ones are
+    the ones left idle. A connection idle for check_after seconds is
+    pinged before it is handed out, and replaced if the ping fails, e.g.
+    after PostgreSQL restarted. When every connection is in use get()
+    waits up to timeout seconds for one to be returned. A connection
+    garbage collected without being returned frees its place.
+    """
+
+    def __init__(self, connect, size, timeout, check_after):
+        self.connect = connect
+        self.timeout = timeout
+        self.check_after = check_after
+        # Connections that can still be opened, or borrowed from idle
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._borrowed = {}
+
+    def get(self):
+        """Borrow a healthy connection, opening one if none is idle"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise psycopg2.OperationalError(
+                f'No pooled connection was free within {self.timeout}s'
+            )
+        try:
+            connection = self._get_idle() or self.connect()
+        except BaseException:
+            self._slots.release()
+            raise
+        self._borrowed[id(connection)] = weakref.finalize(
+            connection, self._release_lost, id(connection)
+        )
+        return connection
+
+    def _release_lost(self, key):
+        self._borrowed.pop(key, None)
+        self._slots.release()
+
+    def _get_idle(self):
+        while True:
+            try:
+                connection, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if self._is_healthy(connection, returned_at):
+                return connection
+            self._discard(connection)
+
+    def put(self, connection, close=False):
+        """Return a borrowed connection, closing it if broken or asked to"""
+        self._borrowed.pop(id(connection)).detach()
+        try:
+            if close or connection.closed:
+                self._discard(connection)
+                return
+            status = connection.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._discard(connection)
+                return
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            self._idle.put((connection, time.monotonic()))
+        except psycopg2.Error:
+            self._discard(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Close the idle connections"""
+        while True:
+            try:
+                connection, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(connection)
+
+    def _is_healthy(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            logger.warning('Dropping a broken pooled connection')
+            return False
+        return True
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+
+def get_pool(key, connect, size, timeout, check_after):
+    """Return the pool of the connections made with the same parameters
+
+    Pools aren't shared with forked worker processes, each makes its own.
+    """
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        if key not in _pools:
+            _pools[key] = ConnectionPool(connect, size, timeout, check_after)
+        return _pools[key]
+
+
+def close_pools():
+    """Close the idle connections of every pool"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
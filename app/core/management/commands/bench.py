@@ -0,0 +1,267 @@
+import json
+import multiprocessing
+import statistics
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Exists, OuterRef
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core import benchmark, models, timing
+from core.db.pool import close_pools
+
+
+LOGIN_EMAIL = 'bench-login@example.com'
+LOGIN_PASSWORD = 'bench-password'
+CREATED_TITLE = 'Bench recipe'
+
+
+def endpoint_requests(user):
+    """Return the (method, path, data, token) of each endpoint for a user
+
+    user is a dict of the user's token, recipe id and tag ids.
+    """
+    recipes = reverse('recipe:recipe-list')
+    token = user['token']
+    return OrderedDict([
+        ('recipes list', ('get', recipes, {}, token)),
+        ('recipes ordered by price',
+         ('get', recipes, {'ordering': 'price'}, token)),
+        ('recipes search', ('get', recipes, {'search': 'recipe 1'}, token)),
+        ('recipes by tags',
+         ('get', recipes, {'tags': user['tags'], 'match': 'all'}, token)),
+        ('recipe detail', ('get', reverse('recipe:recipe-detail',
+                                          args=[user['recipe']]), {}, token)),
+        ('recipe create', ('post', recipes, {
+            'title': CREATED_TITLE, 'time_minutes': 10, 'price': '5.00',
+            'tags': [], 'ingredients': [],
+        }, token)),
+        ('recipes export', ('get', reverse('recipe:recipe-export'), {},
+                            token)),
+        ('tags list', ('get', reverse('recipe:tag-list'), {}, token)),
+        ('ingredients list',
+         ('get', reverse('recipe:ingredient-list'), {}, token)),
+        ('user me', ('get', reverse('user:me'), {}, token)),
+        ('user token', ('post', reverse('user:token'), {
+            'email': LOGIN_EMAIL, 'password': LOGIN_PASSWORD,
+        }, None)),
+    ])
+
+
+def run_endpoint(name, users, count, offset, warmup=0):
+    """Return the (seconds, queries, ok) of requests to one endpoint
+
+    Requests go through the test client, so the whole middleware and
+    view stack runs, cycling through the users from offset.
+    """
+    client = APIClient()
+    results = []
+    for i in range(-warmup, count):
+        user = users[(offset + i) % len(users)]
+        method, path, data, token = endpoint_requests(user)[name]
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        with timing.recording() as timings, \
+                connection.execute_wrapper(timings.execute_wrapper):
+            started = time.perf_counter()
+            if method == 'get':
+                response = client.get(path, data, **headers)
+            else:
+                response = client.post(path, data, format='json', **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        if i >= 0:
+            results.append((elapsed, timings.queries,
+                            response.status_code < 400))
+    return results
+
+
+def summarize(results, elapsed):
+    """Return the latency percentiles, throughput and queries per request"""
+    latencies = sorted(seconds * 1000 for seconds, queries, ok in results)
+    return OrderedDict([
+        ('requests', len(results)),
+        ('errors', sum(1 for seconds, queries, ok in results if not ok)),
+        ('p50_ms', round(benchmark.percentile(latencies, 0.5), 3)),
+        ('p95_ms', round(benchmark.percentile(latencies, 0.95), 3)),
+        ('p99_ms', round(benchmark.percentile(latencies, 0.99), 3)),
+        ('requests_per_second', round(len(results) / elapsed, 1)),
+        ('queries_per_request', round(statistics.mean(
+            queries for seconds, queries, ok in results), 2)),
+    ])
+
+
+class Command(BaseCommand):
+    """Django command to load test the recipe and user endpoints"""
+    help = ('Optionally seed a dataset, then send requests to each recipe '
+            'and user endpoint through the test client, in this process '
+            'or in several worker processes, and report latency '
+            'percentiles, throughput and queries per request.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-users', type=int, default=0,
+                            help='Seed this many users before the run')
+        parser.add_argument('--recipes-per-user', type=int, default=1000)
+        parser.add_argument('--tags-per-user', type=int, default=50)
+        parser.add_argument('--ingredients-per-user', type=int, default=200)
+        parser.add_argument('--links-per-recipe', type=int, default=3)
+        parser.add_argument('--users', type=int, default=10,
+                            help='Number of users the requests rotate '
+                                 'through, the newest with recipes')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Unmeasured requests per endpoint and '
+                                 'worker first')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes sending requests concurrently')
+        parser.add_argument('--endpoint', action='append',
+                            help='Only benchmark this endpoint, repeatable')
+        parser.add_argument('--output',
+                            help='Write the results to this JSON file')
+        parser.add_argument('--baseline',
+                            help='Compare with the results of an earlier '
+                                 'run saved with --output')
+
+    def handle(self, *args, **options):
+        if options['seed_users']:
+            self.stdout.write(f'Seeding {options["seed_users"]} users...')
+            benchmark.seed_dataset(
+                options['seed_users'], options['recipes_per_user'],
+                options['tags_per_user'], options['ingredients_per_user'],
+                options['links_per_recipe']
+            )
+        users = self._bench_users(options['users'])
+        names = list(endpoint_requests(users[0]))
+        if options['endpoint']:
+            unknown = set(options['endpoint']) - set(names)
+            if unknown:
+                raise CommandError(
+                    f'Unknown endpoints: {", ".join(sorted(unknown))}. '
+                    f'Choose from {", ".join(names)}.'
+                )
+            names = [name for name in names if name in options['endpoint']]
+
+        # The test client's host has to be allowed outside of tests too
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            endpoints = self._run(names, users, options)
+
+        results = OrderedDict([
+            ('created', timezone.now().isoformat()),
+            ('options', {key: options[key] for key in (
+                'users', 'requests', 'warmup', 'workers')}),
+            ('endpoints', endpoints),
+        ])
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                self._compare(json.load(f)['endpoints'], endpoints)
+
+    def _bench_users(self, count):
+        """Return the id, token, a recipe and tags of the users to rotate"""
+        user_ids = list(
+            get_user_model().objects.annotate(has_recipes=Exists(
+                models.Recipe.objects.filter(user=OuterRef('pk'))
+            )).filter(has_recipes=True).order_by('-id')
+            .values_list('id', flat=True)[:count]
+        )
+        if not user_ids:
+            raise CommandError('No user has recipes, seed some data first')
+        login = get_user_model().objects.filter(email=LOGIN_EMAIL).first()
+        if login is None:
+            get_user_model().objects.create_user(LOGIN_EMAIL, LOGIN_PASSWORD)
+
+        users = []
+        for user_id in user_ids:
+            token, created = Token.objects.get_or_create(user_id=user_id)
+            tags = models.Tag.objects.filter(user_id=user_id) \
+                .order_by('id').values_list('id', flat=True)[:2]
+            users.append({
+                'id': user_id,
+                'token': token.key,
+                'recipe': models.Recipe.objects.filter(user_id=user_id)
+                .values_list('id', flat=True).first(),
+                'tags': ','.join(str(pk) for pk in tags),
+            })
+        return users
+
+    def _run(self, names, users, options):
+        """Return the summary of each endpoint's requests"""
+        workers = options['workers']
+        per_worker = max(options['requests'] // workers, 1)
+        pool = None
+        if workers > 1:
+            # Forked workers must not share the parent's connections
+            connections.close_all()
+            close_pools()
+            pool = multiprocessing.get_context('fork').Pool(workers)
+
+        endpoints = OrderedDict()
+        self.stdout.write(f'{"Endpoint":<26}{"p50 ms":>9}{"p95 ms":>9}'
+                          f'{"p99 ms":>9}{"req/s":>9}{"queries":>9}')
+        try:
+            for name in names:
+                last_id = models.Recipe.objects.order_by('-id') \
+                    .values_list('id', flat=True).first() or 0
+                started = time.perf_counter()
+                if pool is None:
+                    results = run_endpoint(name, users, options['requests'],
+                                           0, options['warmup'])
+                else:
+                    chunks = pool.starmap(run_endpoint, [
+                        (name, users, per_worker, worker * per_worker,
+                         options['warmup'])
+                        for worker in range(workers)
+                    ])
+                    results = [result for chunk in chunks
+                               for result in chunk]
+                summary = summarize(results, time.perf_counter() - started)
+                endpoints[name] = summary
+                # Later endpoints and runs must see the same dataset
+                self._delete_created(users, last_id)
+                line = (f'{name:<26}{summary["p50_ms"]:>9.2f}'
+                        f'{summary["p95_ms"]:>9.2f}'
+                        f'{summary["p99_ms"]:>9.2f}'
+                        f'{summary["requests_per_second"]:>9.1f}'
+                        f'{summary["queries_per_request"]:>9.1f}')
+                if summary['errors']:
+                    line = self.style.WARNING(
+                        f'{line}  {summary["errors"]} errors'
+                    )
+                self.stdout.write(line)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return endpoints
+
+    def _delete_created(self, users, last_id):
+        """Delete the recipes the create endpoint added after last_id"""
+        models.Recipe.objects.filter(
+            id__gt=last_id, title=CREATED_TITLE,
+            user_id__in=[user['id'] for user in users]
+        ).delete()
+
+    def _compare(self, baseline, endpoints):
+        """Print the change of each endpoint from a baseline run"""
+        self.stdout.write('Change from baseline')
+        for name, summary in endpoints.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            changes = ', '.join(
+                f'{key} {(summary[key] - before[key]) / before[key]:+.0%}'
+                for key in ('p50_ms', 'p95_ms', 'requests_per_second')
+                if before[key]
+            )
+            self.stdout.write(f'  {name}: {changes}')
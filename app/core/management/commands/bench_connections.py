@@ -0,0 +1,57 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.utils import load_backend
+from core.benchmark import percentile
+
+
+BACKENDS = (
+    ('Unpooled', 'django.db.backends.postgresql'),
+    ('Pooled', 'core.db'),
+)
+
+
+class Command(BaseCommand):
+    """Django command to compare pooled and unpooled request latency"""
+    help = ('Run short requests, each connecting, running one query and '
+            'closing the connection as Django does after a request, with '
+            'and without the core.db connection pool.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per thread and backend')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Threads making requests concurrently')
+
+    def handle(self, *args, **options):
+        for label, engine in BACKENDS:
+            settings_dict = {**connection.settings_dict, 'ENGINE': engine}
+            with ThreadPoolExecutor(options['threads']) as executor:
+                started = time.perf_counter()
+                timings = sorted(sum(executor.map(
+                    lambda i: self._requests(engine, settings_dict,
+                                             options['requests']),
+                    range(options['threads'])
+                ), []))
+                elapsed = time.perf_counter() - started
+
+            self.stdout.write(
+                f'{label}: mean {statistics.mean(timings) * 1000:.2f} ms, '
+                f'p50 {percentile(timings, 0.5) * 1000:.2f} ms, '
+                f'p95 {percentile(timings, 0.95) * 1000:.2f} ms, '
+                f'{len(timings) / elapsed:.0f} requests/s'
+            )
+
+    def _requests(self, engine, settings_dict, count):
+        """Return the duration of each request made in this thread"""
+        wrapper = load_backend(engine).DatabaseWrapper(dict(settings_dict))
+        timings = []
+        for i in range(count):
+            started = time.perf_counter()
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            wrapper.close()
+            timings.append(time.perf_counter() - started)
+        return timings
@@ -0,0 +1,98 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from core import models
+from recipe import serializers
+from recipe.rows import RowSerializer
+
+
+def best_time(function, repeat):
+    """Return the fastest of repeat runs in seconds, and the last result"""
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    """Django command to time rendering recipe lists per object"""
+    help = ('Render the same recipes with RecipeSerializer over model '
+            'instances and with the values() row path the list and bulk '
+            'endpoints use, then report the cost per recipe of each.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email',
+                            help='Render the recipes of this user, defaults '
+                                 'to the owner of the newest recipe')
+        parser.add_argument('--recipes', type=int, default=500,
+                            help='Number of recipes rendered per run')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs of each path, the fastest is reported')
+
+    def handle(self, *args, **options):
+        user = self._get_user(options['email'])
+        queryset = models.Recipe.objects.defer('search_vector') \
+            .filter(user=user).order_by('-id')[:options['recipes']]
+        context = {'request': Request(APIRequestFactory().get('/'))}
+        renderer = JSONRenderer()
+
+        def render_instances():
+            recipes = queryset.prefetch_related(*(
+                Prefetch(name, queryset=model.objects.only('id')
+                         .order_by('id'))
+                for name, model in (('tags', models.Tag),
+                                    ('ingredients', models.Ingredient))
+            ))
+            return renderer.render(serializers.RecipeSerializer(
+                recipes, many=True, context=context
+            ).data)
+
+        def render_rows():
+            rows = RowSerializer(serializers.RecipeSerializer(
+                context=context
+            ))
+            return renderer.render(rows.serialize(rows.values(queryset)))
+
+        count = queryset.count()
+        if not count:
+            raise CommandError('The user has no recipes to render')
+        self.stdout.write(f'Rendering {count} recipes of {user.email}, '
+                          f'best of {options["repeat"]} runs')
+
+        results = {}
+        for label, function in (('Serializer', render_instances),
+                                ('Rows', render_rows)):
+            seconds, content = best_time(function, options['repeat'])
+            results[label] = (seconds, content)
+            self.stdout.write(
+                f'  {label}: {seconds * 1000:.1f} ms, '
+                f'{seconds / count * 1e6:.1f} us per recipe'
+            )
+
+        (slow, expected), (fast, rendered) = results.values()
+        if rendered != expected:
+            raise CommandError('The row path renders different JSON')
+        self.stdout.write(self.style.SUCCESS(
+            f'Same output, rows are {slow / fast:.1f}x faster'
+        ))
+
+    def _get_user(self, email):
+        """Return the user whose recipes are rendered"""
+        if email:
+            users = get_user_model().objects.filter(email=email)
+        else:
+            users = get_user_model().objects.filter(
+                id__in=models.Recipe.objects.order_by('-id')
+                .values('user')[:1]
+            )
+        user = users.first()
+        if user is None:
+            raise CommandError('No user with recipes, seed some data first')
+        return user
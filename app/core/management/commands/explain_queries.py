@@ -0,0 +1,224 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from core import benchmark, models
+from recipe import filters, rows, views
+
+
+def explain(queryset, analyze=False):
+    """Return the JSON EXPLAIN output of a queryset
+
+    The plan is under 'Plan', analyzing also runs the query and adds its
+    'Execution Time' in milliseconds.
+    """
+    sql, params = queryset.query.sql_with_params()
+    options = 'ANALYZE, FORMAT JSON' if analyze else 'FORMAT JSON'
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN ({options}) {sql}', params)
+        return cursor.fetchone()[0][0]
+
+
+def format_scan(node, relation, index):
+    scan = f'{node} on {relation}'
+    if index:
+        scan += f' using {index}'
+    return scan
+
+
+def plan_scans(plan):
+    """Yield (node type, relation, index) for every scan in a plan"""
+    if 'Relation Name' in plan or 'Index Name' in plan:
+        yield (plan['Node Type'], plan.get('Relation Name'),
+               plan.get('Index Name'))
+    for child in plan.get('Plans', ()):
+        yield from plan_scans(child)
+
+
+def plan_sorts(plan):
+    """Yield the sort keys of every sort in a plan"""
+    if plan['Node Type'] in ('Sort', 'Incremental Sort'):
+        yield plan['Sort Key']
+    for child in plan.get('Plans', ()):
+        yield from plan_sorts(child)
+
+
+class Command(BaseCommand):
+    """Django command to EXPLAIN the per-user API queries"""
+    help = ('Optionally seed a large dataset, then print how PostgreSQL '
+            'scans each table for the tag, ingredient and recipe endpoints.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-users', type=int, default=0,
+                            help='Seed this many users before explaining')
+        parser.add_argument('--recipes-per-user', type=int, default=1000)
+        parser.add_argument('--tags-per-user', type=int, default=50)
+        parser.add_argument('--ingredients-per-user', type=int, default=200)
+        parser.add_argument('--links-per-recipe', type=int, default=3)
+        parser.add_argument('--email',
+                            help='Explain the queries of this user, '
+                                 'defaults to the owner of the newest recipe')
+        parser.add_argument('--filter-sizes', default='1,10,50',
+                            help='Comma separated numbers of tag and '
+                                 'ingredient ids to benchmark filtering by')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Also run the filter benchmarks and report '
+                                 'their execution time')
+        parser.add_argument('--fail-on-seq-scan', action='store_true',
+                            help='Exit with an error if any query uses a '
+                                 'sequential scan')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN checks require PostgreSQL')
+
+        if options['seed_users']:
+            self._seed(options)
+        with connection.cursor() as cursor:
+            for table in benchmark.ANALYZE_TABLES:
+                cursor.execute(f'ANALYZE {table}')
+
+        user = self._get_user(options['email'])
+        seq_scans = 0
+        for label, queryset in self._querysets(user):
+            self.stdout.write(label)
+            plan = explain(queryset)['Plan']
+            for node, relation, index in plan_scans(plan):
+                scan = '  ' + format_scan(node, relation, index)
+                if node == 'Seq Scan':
+                    seq_scans += 1
+                    scan = self.style.WARNING(scan)
+                self.stdout.write(scan)
+            for keys in plan_sorts(plan):
+                self.stdout.write(f"  Sort by {', '.join(keys)}")
+
+        sizes = sorted({int(size) for size in
+                        options['filter_sizes'].split(',') if size.strip()})
+        if sizes:
+            self._benchmark_filters(user, sizes, options['analyze'])
+
+        if seq_scans and options['fail_on_seq_scan']:
+            raise CommandError(f'{seq_scans} sequential scan(s) found')
+        self.stdout.write(self.style.SUCCESS(
+            f'{seq_scans} sequential scan(s) found'
+        ))
+
+    def _seed(self, options):
+        """Bulk insert the synthetic dataset in SQL"""
+        self.stdout.write(f'Seeding {options["seed_users"]} users with '
+                          f'{options["recipes_per_user"]} recipes each...')
+        benchmark.seed_dataset(
+            options['seed_users'], options['recipes_per_user'],
+            options['tags_per_user'], options['ingredients_per_user'],
+            options['links_per_recipe']
+        )
+
+    def _get_user(self, email):
+        """Return the user whose queries are explained"""
+        if email:
+            users = get_user_model().objects.filter(email=email)
+        else:
+            users = get_user_model().objects.filter(
+                id__in=models.Recipe.objects.order_by('-id')
+                .values('user')[:1]
+            )
+        user = users.first()
+        if user is None:
+            raise CommandError('No user to explain, seed some data first')
+        return user
+
+    def _view_queryset(self, viewset, user, params=None):
+        """Return the queryset a list request would make
+
+        Recipes are listed as rows with their tag and ingredient ids, so
+        their plan is the one of those rows.
+        """
+        request = Request(APIRequestFactory().get('/', params or {}))
+        request.user = user
+        view = viewset(action='list', request=request, format_kwarg=None)
+        if viewset is views.RecipeViewset:
+            return view.get_rows_queryset(
+                rows.RowSerializer(view.get_serializer())
+            )
+        return view.filter_queryset(view.get_queryset())
+
+    def _querysets(self, user):
+        """Yield the labelled querysets the endpoints run for the user"""
+        tag_ids = ','.join(str(pk) for pk in models.Tag.objects.filter(
+            user=user).values_list('id', flat=True)[:2])
+        ingredient_ids = ','.join(str(pk) for pk in models.Ingredient.objects
+                                  .filter(user=user)
+                                  .values_list('id', flat=True)[:2])
+        page_size = views.RecipeViewset.pagination_class.page_size
+
+        yield 'Tag list', self._view_queryset(views.TagViewSet, user)
+        yield 'Tag list assigned only', self._view_queryset(
+            views.TagViewSet, user, {'assigned_only': 1})
+        yield 'Ingredient list', self._view_queryset(
+            views.IngredientViewSet, user)
+        yield 'Ingredient list assigned only', self._view_queryset(
+            views.IngredientViewSet, user, {'assigned_only': 1})
+        yield 'Recipe list', self._view_queryset(
+            views.RecipeViewset, user)[:page_size]
+        yield 'Recipe search', self._view_queryset(
+            views.RecipeViewset, user, {'search': 'recipe 1'})[:page_size]
+        for ordering in views.RecipeViewset.ordering_fields[1:]:
+            for prefix in ('', '-'):
+                yield f'Recipe list ordered by {prefix}{ordering}', \
+                    self._view_queryset(views.RecipeViewset, user, {
+                        'ordering': prefix + ordering,
+                    })[:page_size]
+        yield 'Recipe list by max time and price range', self._view_queryset(
+            views.RecipeViewset, user, {
+                'ordering': 'price', 'max_time': 20,
+                'min_price': 5, 'max_price': 10,
+            })[:page_size]
+        if tag_ids:
+            yield 'Recipe list by tags', self._view_queryset(
+                views.RecipeViewset, user, {'tags': tag_ids})[:page_size]
+        if ingredient_ids:
+            yield 'Recipe list by ingredients', self._view_queryset(
+                views.RecipeViewset, user,
+                {'ingredients': ingredient_ids})[:page_size]
+
+    def _benchmark_filters(self, user, sizes, analyze):
+        """Explain the recipe filters as the number of ids grows
+
+        The filters use EXISTS and aggregate subqueries, so the plan is
+        expected to keep its shape and its cost to grow with the number
+        of matching links only.
+        """
+        page_size = views.RecipeViewset.pagination_class.page_size
+        for field, model in (('tags', models.Tag),
+                             ('ingredients', models.Ingredient)):
+            ids = list(model.objects.filter(user=user).order_by('id')
+                       .values_list('id', flat=True)[:sizes[-1]])
+            if not ids:
+                continue
+            for match in filters.MATCH_MODES:
+                self.stdout.write(f'Recipe filter by {field} ({match})')
+                plans = {}
+                for size in sorted({min(size, len(ids)) for size in sizes}):
+                    queryset = self._view_queryset(
+                        views.RecipeViewset, user, {
+                            field: ','.join(str(pk) for pk in ids[:size]),
+                            'match': match,
+                        })[:page_size]
+                    result = explain(queryset, analyze)
+                    plans.setdefault(
+                        tuple(plan_scans(result['Plan'])), []
+                    ).append(size)
+                    line = f"  {size} ids: cost {result['Plan']['Total Cost']}"
+                    if analyze:
+                        line += f", {result['Execution Time']:.2f} ms"
+                    self.stdout.write(line)
+
+                if len(plans) == 1:
+                    self.stdout.write('  Same plan for every size')
+                    continue
+                for scans, plan_sizes in plans.items():
+                    self.stdout.write(self.style.WARNING(
+                        f"  Plan for {', '.join(map(str, plan_sizes))} ids: "
+                        + ', '.join(format_scan(*scan) for scan in scans)
+                    ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from core import models
+from recipe import images
+
+
+class Command(BaseCommand):
+    """Django command to resize recipe images uploaded without variants"""
+    help = ('Generate the thumbnail, medium and WebP variants of recipe '
+            'images that have none, e.g. those uploaded before variants '
+            'existed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate the variants of every image, '
+                                 'replacing existing ones')
+
+    def handle(self, *args, **options):
+        recipes = models.Recipe.objects.exclude(image='').exclude(
+            image__isnull=True
+        )
+        if not options['all']:
+            recipes = recipes.filter(image_variants__isnull=True)
+
+        done = failed = 0
+        for recipe_id, user_id, image in recipes.order_by('id') \
+                .values_list('id', 'user_id', 'image').iterator():
+            try:
+                images.generate_variants(recipe_id, user_id, image,
+                                         force=options['all'])
+            except (IOError, SyntaxError) as exc:
+                # Pillow raises SyntaxError for some broken files
+                failed += 1
+                self.stderr.write(f'Recipe {recipe_id}: {exc}')
+            else:
+                done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated variants of {done} images, {failed} failed'
+        ))
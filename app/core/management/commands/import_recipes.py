@@ -0,0 +1,255 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from itertools import islice
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from core import models
+from recipe import cache
+
+
+RELATIONS = (
+    ('tags', models.Tag, 'core_recipe_tags', 'tag_id'),
+    ('ingredients', models.Ingredient, 'core_recipe_ingredients',
+     'ingredient_id'),
+)
+
+
+def read_records(stream, input_format):
+    """Yield recipe dicts from NDJSON lines or CSV rows
+
+    Raises CommandError for a line that isn't a JSON object.
+    """
+    if input_format == 'csv':
+        for row in csv.DictReader(stream):
+            for field, *rest in RELATIONS:
+                value = row.get(field) or ''
+                row[field] = [name for name in value.split('|') if name]
+            yield row
+    else:
+        number = 0
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                raise CommandError(f'Record {number} is invalid: line '
+                                   f'{line_number} is not JSON ({exc})')
+            if not isinstance(record, dict):
+                raise CommandError(f'Record {number} is invalid: line '
+                                   f'{line_number} is not a JSON object')
+            yield record
+
+
+COLUMNS = ('title', 'time_minutes', 'price', 'link')
+
+
+def clean_record(record):
+    """Return the recipe columns and related names of a record
+
+    Values are checked against the model fields, e.g. their max_length
+    or max_digits, so COPY never gets a value the column can't hold.
+    Raises ValidationError.
+    """
+    def optional(field, value):
+        return None if value in (None, '') else field.clean(value, None)
+
+    names = {}
+    for field, model, *rest in RELATIONS:
+        name_field = model._meta.get_field('name')
+        names[field] = list(dict.fromkeys(
+            name_field.clean(str(name).strip(), None)
+            for name in record.get(field) or () if str(name).strip()
+        ))
+    return tuple(
+        optional(models.Recipe._meta.get_field(column), record.get(column))
+        for column in COLUMNS
+    ), names
+
+
+def copy_value(value):
+    """Format a value for COPY's text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, int):
+        return str(value)
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t') \
+        .replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Load rows into a table with COPY FROM STDIN"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(
+        f'COPY {table} ({", ".join(columns)}) FROM STDIN', buffer
+    )
+
+
+class Command(BaseCommand):
+    """Django command to bulk import recipes for a user"""
+    help = ('Stream recipes from an NDJSON or CSV file (as written by the '
+            'export endpoint) into the database with COPY, in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, '-' for stdin")
+        parser.add_argument('--email', required=True,
+                            help='Owner of the imported recipes')
+        parser.add_argument('--format', dest='input_format',
+                            choices=('ndjson', 'csv'),
+                            help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--checkpoint',
+                            help='File recording how many records were '
+                                 'imported, defaults to PATH.checkpoint')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Importing requires PostgreSQL')
+        try:
+            self.user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['email']} does not exist")
+
+        path = options['path']
+        input_format = options['input_format'] or (
+            'csv' if path.endswith('.csv') else 'ndjson'
+        )
+        checkpoint = options['checkpoint'] or (
+            None if path == '-' else f'{path}.checkpoint'
+        )
+        done = 0
+        if checkpoint and not options['restart'] \
+                and os.path.exists(checkpoint):
+            done = self._read_checkpoint(checkpoint)
+            self.stdout.write(f'Resuming after {done} records')
+
+        # name -> id of the user's tags and ingredients
+        self.ids = {
+            field: dict(model.objects.filter(user=self.user)
+                        .values_list('name', 'id'))
+            for field, model, *rest in RELATIONS
+        }
+        self.stats = {'recipes': 0, 'links': 0, 'names': 0}
+
+        stream = sys.stdin if path == '-' else open(path, newline='')
+        started = time.monotonic()
+        try:
+            records = islice(read_records(stream, input_format), done, None)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                self._load(batch, done, checkpoint)
+                done += len(batch)
+                if checkpoint:
+                    self._save_checkpoint(checkpoint, done)
+                self._report(started)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.stats['recipes']} recipes, "
+            f"{self.stats['links']} links and {self.stats['names']} new "
+            f"tags/ingredients in {elapsed:.1f}s "
+            f"({self.stats['recipes'] / max(elapsed, 1e-9):.0f} recipes/s)"
+        ))
+
+    def _load(self, batch, offset, checkpoint=None):
+        """Insert one batch of records in a single transaction"""
+        rows = []
+        for number, record in enumerate(batch, offset + 1):
+            try:
+                rows.append(clean_record(record))
+            except ValidationError as exc:
+                raise CommandError(f'Record {number} is invalid: '
+                                   f'{" ".join(exc.messages)}')
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for field, model, *rest in RELATIONS:
+                self._resolve(field, model,
+                              {name for columns, names in rows
+                               for name in names[field]})
+
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence('core_recipe', 'id')) "
+                "FROM generate_series(1, %s)", [len(rows)]
+            )
+            recipe_ids = [pk for pk, in cursor.fetchall()]
+            copy_rows(
+                cursor, 'core_recipe',
+                ('id', 'user_id', 'title', 'time_minutes', 'price', 'link'),
+                ((pk, self.user.id) + columns
+                 for pk, (columns, names) in zip(recipe_ids, rows))
+            )
+            for field, model, table, column in RELATIONS:
+                links = [(pk, self.ids[field][name])
+                         for pk, (columns, names) in zip(recipe_ids, rows)
+                         for name in names[field]]
+                copy_rows(cursor, table, ('recipe_id', column), links)
+                self.stats['links'] += len(links)
+
+            cache.bump_on_commit([self.user.id], 'recipe', 'tag',
+                                 'ingredient')
+            if checkpoint:
+                # Written before the commit, a resume after a crash finds
+                # out whether the batch made it from its first recipe
+                self._save_checkpoint(checkpoint, offset, len(rows),
+                                      recipe_ids[0])
+        self.stats['recipes'] += len(rows)
+
+    def _resolve(self, field, model, names):
+        """Add ids for names not seen before, creating missing rows"""
+        missing = [name for name in names if name not in self.ids[field]]
+        if not missing:
+            return
+        for obj, created in model.objects.bulk_get_or_create(self.user,
+                                                             missing):
+            self.ids[field][obj.name] = obj.id
+            self.stats['names'] += created
+
+    def _read_checkpoint(self, checkpoint):
+        """Return the number of records imported before
+
+        A checkpoint holding a pending batch, the batch size and its
+        first recipe id after the count, counts the batch if the recipe
+        was committed.
+        """
+        with open(checkpoint) as f:
+            done, *pending = (int(value)
+                              for value in f.read().split() or ['0'])
+        if pending:
+            size, first_id = pending
+            if models.Recipe.objects.filter(id=first_id,
+                                            user=self.user).exists():
+                done += size
+        return done
+
+    def _save_checkpoint(self, checkpoint, done, pending=None,
+                         first_id=None):
+        """Record progress, replacing the file atomically"""
+        with open(f'{checkpoint}.tmp', 'w') as f:
+            f.write(str(done) if pending is None
+                    else f'{done} {pending} {first_id}')
+        os.replace(f'{checkpoint}.tmp', checkpoint)
+
+    def _report(self, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"{self.stats['recipes']} recipes "
+            f"({self.stats['recipes'] / max(elapsed, 1e-9):.0f}/s)"
+        )
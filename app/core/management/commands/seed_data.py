@@ -0,0 +1,129 @@
+import argparse
+import multiprocessing
+import time
+from functools import partial
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from core import benchmark, synthetic
+from core.db.pool import close_pools
+
+
+def distribution(value):
+    """argparse type of the distribution options"""
+    try:
+        return synthetic.Distribution.parse(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(
+            f"invalid distribution '{value}', use N, MIN-MAX or "
+            f"exp:MEAN[:MAX] ({exc})"
+        )
+
+
+def seed_chunk(chunk, config):
+    """Generate and insert one chunk of users in its own transaction"""
+    users = synthetic.generate_chunk(config, chunk)
+    with transaction.atomic(), connection.cursor() as cursor:
+        return synthetic.insert_chunk(cursor, users, config.password)
+
+
+class Command(BaseCommand):
+    """Django command to generate a large realistic dataset"""
+    help = ('Generate users with tags, ingredients and recipes drawn from '
+            'shared vocabularies, with configurable distributions, and load '
+            'them with COPY in chunks of users, optionally in several '
+            'worker processes. The same --seed and --chunk-size generate '
+            'the same data whatever the number of workers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes-per-user', type=distribution,
+                            default='exp:20:1000',
+                            help='N, MIN-MAX or exp:MEAN[:MAX]')
+        parser.add_argument('--tags-per-user', type=distribution,
+                            default='5-30')
+        parser.add_argument('--ingredients-per-user', type=distribution,
+                            default='20-120')
+        parser.add_argument('--tags-per-recipe', type=distribution,
+                            default='0-4')
+        parser.add_argument('--ingredients-per-recipe', type=distribution,
+                            default='3-12')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random generators')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Users generated and inserted per '
+                                 'transaction')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes generating chunks concurrently')
+        parser.add_argument('--email-prefix', default='synthetic',
+                            help='Emails are PREFIX-SEED-N@example.com')
+        parser.add_argument('--password', default='password',
+                            help='Password of every user, hashed once')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Seeding loads rows with PostgreSQL COPY')
+        if options['users'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--users and --chunk-size must be positive')
+
+        config = synthetic.SeedConfig(
+            seed=options['seed'],
+            users=options['users'],
+            chunk_size=options['chunk_size'],
+            email_prefix=options['email_prefix'],
+            # Hashing is slow by design, so every user shares one hash
+            password=make_password(options['password']),
+            recipes=options['recipes_per_user'],
+            tags=options['tags_per_user'],
+            ingredients=options['ingredients_per_user'],
+            recipe_tags=options['tags_per_recipe'],
+            recipe_ingredients=options['ingredients_per_recipe'],
+        )
+        first_email = synthetic.user_email(config, 1)
+        if get_user_model().objects.filter(email=first_email).exists():
+            raise CommandError(f'{first_email} already exists, choose '
+                               f'another --seed or --email-prefix')
+
+        chunks = range(-(-config.users // config.chunk_size))
+        self.stdout.write(f'Seeding {config.users} users in {len(chunks)} '
+                          f'chunks with {options["workers"]} worker(s)...')
+        started = time.perf_counter()
+        totals = dict.fromkeys(('users', 'tags', 'ingredients', 'recipes',
+                                'links'), 0)
+        for counts in self._seed_chunks(config, chunks, options['workers']):
+            for key, count in counts.items():
+                totals[key] += count
+            self.stdout.write(f'  {totals["users"]}/{config.users} users, '
+                              f'{totals["recipes"]} recipes')
+        elapsed = time.perf_counter() - started
+
+        with connection.cursor() as cursor:
+            for table in benchmark.ANALYZE_TABLES:
+                cursor.execute(f'ANALYZE {table}')
+
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {totals["users"]} users, {totals["tags"]} tags, '
+            f'{totals["ingredients"]} ingredients, {totals["recipes"]} '
+            f'recipes and {totals["links"]} links in {elapsed:.1f} s, '
+            f'{rows / elapsed:.0f} rows/s'
+        ))
+
+    def _seed_chunks(self, config, chunks, workers):
+        """Yield the row counts of each chunk as it is inserted"""
+        if workers <= 1:
+            for chunk in chunks:
+                yield seed_chunk(chunk, config)
+            return
+
+        # Forked workers must not share the parent's connections
+        connections.close_all()
+        close_pools()
+        pool = multiprocessing.get_context('fork').Pool(workers)
+        try:
+            yield from pool.imap_unordered(partial(seed_chunk, config=config),
+                                           chunks)
+        finally:
+            pool.close()
+            pool.join()
@@ -1,21 +1,51 @@
 import time
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
     """Django command to pause execution until database is available"""
+    help = ('Connect to the database until it answers, waiting twice as '
+            'long after each failure, and give up after --timeout seconds.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Seconds to wait in total')
+        parser.add_argument('--delay', type=float, default=0.5,
+                            help='Seconds to wait after the first failure')
+        parser.add_argument('--max-delay', type=float, default=5,
+                            help='Longest wait between attempts')
 
     def handle(self, *args, **options):
         self.stdout.write('Waiting for db...')
-        db_conn = None
+        connection = connections[options['database']]
+        deadline = time.monotonic() + options['timeout']
+        delay = options['delay']
 
-        while not db_conn:
+        while True:
             try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('DB unavailable, waiting 1 second...')
-                time.sleep(1)
+                # Opening the connection isn't enough, PostgreSQL accepts
+                # connections before it can answer queries
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                break
+            except OperationalError as exc:
+                # A connection that opened but failed a query is broken,
+                # the next attempt has to open a new one
+                connection.close()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'DB unavailable after {options["timeout"]:g} '
+                        f'seconds: {exc}'
+                    )
+                delay = min(delay, remaining)
+                self.stdout.write(
+                    f'DB unavailable, waiting {delay:.2g} seconds...'
+                )
+                time.sleep(delay)
+                delay = min(delay * 2, options['max_delay'])
 
         self.stdout.write(self.style.SUCCESS('DB is available!'))
@@ -0,0 +1,189 @@
+import logging
+import random
+import re
+import time
+import zlib
+from contextlib import ExitStack
+import brotli
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from core import timing
+
+
+timing_logger = logging.getLogger('core.timing')
+
+
+ACCEPT_ENCODING_PART = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q=([\d.]+))?')
+STRONG_ETAG = re.compile(r'^"')
+
+
+def accepted_encoding(header):
+    """Return 'br' or 'gzip' as the client accepts, None for neither
+
+    Brotli wins at equal weight, it compresses JSON smaller.
+    """
+    weights = {}
+    for part in (header or '').split(','):
+        match = ACCEPT_ENCODING_PART.match(part)
+        if match is None:
+            continue
+        try:
+            weight = float(match.group(2) or 1)
+        except ValueError:
+            continue
+        weights[match.group(1).lower()] = weight
+
+    best, best_weight = None, 0
+    for encoding in ('br', 'gzip'):
+        weight = weights.get(encoding, weights.get('*', 0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compressor(encoding):
+    """Return the (compress, flush, finish) functions of a new encoder
+
+    flush() returns what the encoder holds back so far, finish() ends
+    the stream.
+    """
+    if encoding == 'br':
+        encoder = brotli.Compressor(
+            quality=CompressionMiddleware.brotli_quality
+        )
+        return encoder.process, encoder.flush, encoder.finish
+    encoder = zlib.compressobj(CompressionMiddleware.gzip_level,
+                               zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return encoder.compress, \
+        lambda: encoder.flush(zlib.Z_SYNC_FLUSH), encoder.flush
+
+
+def compress_sequence(chunks, encoding):
+    """Yield the compressed chunks of a streaming response
+
+    The encoder is flushed after the first chunk, then once flush_size
+    bytes or flush_interval seconds have gone in since the last flush,
+    so the client gets the stream as it is produced rather than when
+    the encoder's buffers fill.
+    """
+    compress, flush, finish = compressor(encoding)
+    pending, flushed = 0, None
+    for chunk in chunks:
+        data = compress(chunk)
+        pending += len(chunk)
+        now = time.monotonic()
+        if flushed is None or \
+                pending >= CompressionMiddleware.flush_size or \
+                now - flushed >= CompressionMiddleware.flush_interval:
+            data += flush()
+            pending, flushed = 0, now
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress responses with brotli or gzip, as the client accepts
+
+    Only the COMPRESSION_CONTENT_TYPES are compressed, complete responses
+    from COMPRESSION_MIN_SIZE bytes, streaming ones like the recipe
+    export as they are sent. Uploads under MEDIA_URL are images, already
+    compressed, and are left alone. So are responses using a CSRF token,
+    compressing a secret next to content an attacker can influence
+    exposes it to BREACH.
+    """
+    # Fast levels, large recipe lists are compressed per request
+    brotli_quality = 4
+    gzip_level = 6
+    # Streaming responses are flushed after this many bytes or seconds
+    flush_size = 16 * 1024
+    flush_interval = 0.2
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '') \
+            .split(';')[0].strip().lower()
+        if (response.has_header('Content-Encoding') or
+                response.status_code != 200 or
+                request.path.startswith(settings.MEDIA_URL) or
+                request.META.get('CSRF_COOKIE_USED') or
+                content_type not in settings.COMPRESSION_CONTENT_TYPES or
+                'no-transform' in response.get('Cache-Control', '')):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING')
+        )
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(
+                response.streaming_content, encoding
+            )
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            compress, flush, finish = compressor(encoding)
+            content = compress(response.content) + finish()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # The bytes differ from the uncompressed representation's
+        etag = response.get('ETag')
+        if etag and STRONG_ETAG.match(etag):
+            response['ETag'] = f'W/{etag}'
+        response['Content-Encoding'] = encoding
+        return response
+
+
+class ServerTimingMiddleware:
+    """Report where the time of sampled requests went
+
+    A SERVER_TIMING_SAMPLE_RATE fraction of requests records the number
+    and duration of SQL queries, and the time spent authenticating,
+    serializing and rendering, as recorded by core.timing. They are sent
+    in a Server-Timing header, which browser developer tools show, and
+    logged to core.timing. With a rate of 0 the middleware is removed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.SERVER_TIMING_SAMPLE_RATE
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        with timing.recording() as timings, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(timings.execute_wrapper)
+                )
+            started = time.perf_counter()
+            response = self.get_response(request)
+            total = time.perf_counter() - started
+
+        metrics = [(name, seconds * 1000)
+                   for name, seconds in timings.durations.items()]
+        metrics.append(('total', total * 1000))
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={ms:.2f}' +
+            (f';desc="{timings.queries} queries"' if name == 'sql' else '')
+            for name, ms in metrics
+        )
+        timing_logger.info(
+            '%s %s %s queries=%d %s', request.method, request.path,
+            response.status_code, timings.queries,
+            ' '.join(f'{name}_ms={ms:.2f}' for name, ms in metrics),
+            extra={'timings': dict(metrics, queries=timings.queries)}
+        )
+        return response
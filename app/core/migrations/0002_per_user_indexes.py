@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_index(name, table, columns):
+    """Build the index without locking writes to the table"""
+    return (
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+        f'ON {table} ({columns});'
+    )
+
+
+def drop_index(name):
+    return f'DROP INDEX CONCURRENTLY IF EXISTS {name};'
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=create_index('core_tag_user_name_idx',
+                             'core_tag', 'user_id, name DESC'),
+            reverse_sql=drop_index('core_tag_user_name_idx'),
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='tag',
+                    index=models.Index(fields=['user', '-name'],
+                                       name='core_tag_user_name_idx'),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            sql=create_index('core_ingredient_user_name_idx',
+                             'core_ingredient', 'user_id, name DESC'),
+            reverse_sql=drop_index('core_ingredient_user_name_idx'),
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='ingredient',
+                    index=models.Index(fields=['user', '-name'],
+                                       name='core_ingredient_user_name_idx'),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            sql=create_index('core_recipe_user_id_idx',
+                             'core_recipe', 'user_id, id DESC'),
+            reverse_sql=drop_index('core_recipe_user_id_idx'),
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=models.Index(fields=['user', '-id'],
+                                       name='core_recipe_user_id_idx'),
+                ),
+            ],
+        ),
+        # The auto-created through tables are probed by tag or ingredient
+        # id and read back the recipe id, which the default single column
+        # indexes can only answer with a heap lookup per row.
+        migrations.RunSQL(
+            sql=create_index('core_recipe_tags_tag_recipe_idx',
+                             'core_recipe_tags', 'tag_id, recipe_id'),
+            reverse_sql=drop_index('core_recipe_tags_tag_recipe_idx'),
+        ),
+        migrations.RunSQL(
+            sql=create_index('core_recipe_ingredients_ingredient_recipe_idx',
+                             'core_recipe_ingredients',
+                             'ingredient_id, recipe_id'),
+            reverse_sql=drop_index(
+                'core_recipe_ingredients_ingredient_recipe_idx'
+            ),
+        ),
+        # The composite indexes lead with user_id, which makes the
+        # foreign key's own index redundant.
+        migrations.AlterField(
+            model_name='tag',
+            name='user',
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='user',
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='user',
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,110 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Merge tags and ingredients a user has more than once into one row"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field).through
+        column = f'{model_name.lower()}_id'
+
+        duplicates = model.objects.values('user', 'name') \
+            .annotate(keep=Min('id'), count=Count('id')) \
+            .filter(count__gt=1)
+        for duplicate in duplicates:
+            keep = duplicate['keep']
+            others = model.objects.filter(
+                user=duplicate['user'], name=duplicate['name']
+            ).exclude(id=keep)
+            recipe_ids = set(
+                through.objects.filter(**{f'{column}__in': others})
+                .values_list('recipe_id', flat=True)
+            ) - set(
+                through.objects.filter(**{column: keep})
+                .values_list('recipe_id', flat=True)
+            )
+            through.objects.bulk_create([
+                through(recipe_id=recipe_id, **{column: keep})
+                for recipe_id in recipe_ids
+            ])
+            others.delete()
+
+
+def add_unique(table):
+    """Build the unique index without locking writes, then attach it"""
+    name = f'{table}_user_id_name_uniq'
+    return [
+        f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+        f'ON {table} (user_id, name);',
+        f'ALTER TABLE {table} ADD CONSTRAINT {name} '
+        f'UNIQUE USING INDEX {name};',
+    ]
+
+
+def drop_unique(table):
+    return f'ALTER TABLE {table} DROP CONSTRAINT {table}_user_id_name_uniq;'
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0002_per_user_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names,
+                             migrations.RunPython.noop,
+                             atomic=True),
+        migrations.RunSQL(
+            sql=add_unique('core_tag'),
+            reverse_sql=drop_unique('core_tag'),
+            state_operations=[
+                migrations.AlterUniqueTogether(
+                    name='tag',
+                    unique_together={('user', 'name')},
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            sql=add_unique('core_ingredient'),
+            reverse_sql=drop_unique('core_ingredient'),
+            state_operations=[
+                migrations.AlterUniqueTogether(
+                    name='ingredient',
+                    unique_together={('user', 'name')},
+                ),
+            ],
+        ),
+        # The unique indexes lead with user_id and scan backwards for the
+        # lists ordered by -name, replacing the indexes from 0002.
+        migrations.RunSQL(
+            sql='DROP INDEX CONCURRENTLY IF EXISTS core_tag_user_name_idx;',
+            reverse_sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                        'core_tag_user_name_idx '
+                        'ON core_tag (user_id, name DESC);',
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='tag',
+                    name='core_tag_user_name_idx',
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            sql='DROP INDEX CONCURRENTLY IF EXISTS '
+                'core_ingredient_user_name_idx;',
+            reverse_sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                        'core_ingredient_user_name_idx '
+                        'ON core_ingredient (user_id, name DESC);',
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='ingredient',
+                    name='core_ingredient_user_name_idx',
+                ),
+            ],
+        ),
+    ]
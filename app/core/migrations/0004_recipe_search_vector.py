@@ -0,0 +1,147 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# The 'english' configuration must match the one used to parse queries in
+# recipe.views.RecipeViewset.
+CREATE_TRIGGERS = """
+CREATE FUNCTION core_recipe_document(recipe integer, title text)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(t.name, ' ')
+            FROM core_recipe_tags rt JOIN core_tag t ON t.id = rt.tag_id
+            WHERE rt.recipe_id = recipe), '')), 'B')
+        || setweight(to_tsvector('english', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM core_recipe_ingredients ri
+            JOIN core_ingredient i ON i.id = ri.ingredient_id
+            WHERE ri.recipe_id = recipe), '')), 'C')
+$$ LANGUAGE sql STABLE;
+
+-- Every write of the title or the vector itself recomputes the vector, so
+-- the other triggers refresh a recipe by setting its vector to NULL.
+CREATE FUNCTION core_recipe_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := core_recipe_document(NEW.id, NEW.title);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_search_vector_update
+BEFORE INSERT OR UPDATE OF title, search_vector ON core_recipe
+FOR EACH ROW EXECUTE PROCEDURE core_recipe_search_vector_update();
+
+CREATE FUNCTION core_recipe_links_changed() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe SET search_vector = NULL
+    WHERE id IN (SELECT recipe_id FROM changed);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_recipe_tags_inserted
+AFTER INSERT ON core_recipe_tags REFERENCING NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE PROCEDURE core_recipe_links_changed();
+CREATE TRIGGER core_recipe_tags_deleted
+AFTER DELETE ON core_recipe_tags REFERENCING OLD TABLE AS changed
+FOR EACH STATEMENT EXECUTE PROCEDURE core_recipe_links_changed();
+CREATE TRIGGER core_recipe_ingredients_inserted
+AFTER INSERT ON core_recipe_ingredients REFERENCING NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE PROCEDURE core_recipe_links_changed();
+CREATE TRIGGER core_recipe_ingredients_deleted
+AFTER DELETE ON core_recipe_ingredients REFERENCING OLD TABLE AS changed
+FOR EACH STATEMENT EXECUTE PROCEDURE core_recipe_links_changed();
+
+CREATE FUNCTION core_tag_renamed() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe SET search_vector = NULL
+    WHERE id IN (SELECT recipe_id FROM core_recipe_tags
+                 WHERE tag_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_tag_renamed
+AFTER UPDATE OF name ON core_tag
+FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+EXECUTE PROCEDURE core_tag_renamed();
+
+CREATE FUNCTION core_ingredient_renamed() RETURNS trigger AS $$
+BEGIN
+    UPDATE core_recipe SET search_vector = NULL
+    WHERE id IN (SELECT recipe_id FROM core_recipe_ingredients
+                 WHERE ingredient_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_ingredient_renamed
+AFTER UPDATE OF name ON core_ingredient
+FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+EXECUTE PROCEDURE core_ingredient_renamed();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER core_ingredient_renamed ON core_ingredient;
+DROP FUNCTION core_ingredient_renamed();
+DROP TRIGGER core_tag_renamed ON core_tag;
+DROP FUNCTION core_tag_renamed();
+DROP TRIGGER core_recipe_ingredients_deleted ON core_recipe_ingredients;
+DROP TRIGGER core_recipe_ingredients_inserted ON core_recipe_ingredients;
+DROP TRIGGER core_recipe_tags_deleted ON core_recipe_tags;
+DROP TRIGGER core_recipe_tags_inserted ON core_recipe_tags;
+DROP FUNCTION core_recipe_links_changed();
+DROP TRIGGER core_recipe_search_vector_update ON core_recipe;
+DROP FUNCTION core_recipe_search_vector_update();
+DROP FUNCTION core_recipe_document(integer, text);
+"""
+
+
+def backfill_search_vectors(apps, schema_editor):
+    """Compute the vector of existing recipes in short transactions"""
+    Recipe = apps.get_model('core', 'Recipe')
+    batch = 10000
+    last = Recipe.objects.order_by('-id').values_list('id', flat=True) \
+        .first() or 0
+    for start in range(0, last, batch):
+        Recipe.objects.filter(id__gt=start, id__lte=start + batch) \
+            .update(search_vector=None)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0003_unique_attr_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunPython(backfill_search_vectors,
+                             migrations.RunPython.noop),
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                'core_recipe_search_idx '
+                'ON core_recipe USING gin (search_vector);',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS '
+                        'core_recipe_search_idx;',
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=['search_vector'],
+                        name='core_recipe_search_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations, models
+
+
+def create_index(name, table, columns):
+    """Build the index without locking writes to the table"""
+    return (
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+        f'ON {table} ({columns});'
+    )
+
+
+def drop_index(name):
+    return f'DROP INDEX CONCURRENTLY IF EXISTS {name};'
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0004_recipe_search_vector'),
+    ]
+
+    # The id column makes the index order unique for keyset pagination,
+    # descending sorts scan the indexes backwards.
+    operations = [
+        migrations.RunSQL(
+            sql=create_index('core_recipe_user_time_idx', 'core_recipe',
+                             'user_id, time_minutes, id'),
+            reverse_sql=drop_index('core_recipe_user_time_idx'),
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=models.Index(
+                        fields=['user', 'time_minutes', 'id'],
+                        name='core_recipe_user_time_idx'),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            sql=create_index('core_recipe_user_price_idx', 'core_recipe',
+                             'user_id, price, id'),
+            reverse_sql=drop_index('core_recipe_user_price_idx'),
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='recipe',
+                    index=models.Index(fields=['user', 'price', 'id'],
+                                       name='core_recipe_user_price_idx'),
+                ),
+            ],
+        ),
+    ]
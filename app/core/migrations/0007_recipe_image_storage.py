@@ -0,0 +1,32 @@
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(
+                null=True, storage=core.storage.ContentAddressedStorage(),
+                upload_to=core.models.recipe_image_file_path),
+        ),
+        # Looks up the other recipes sharing an image before deleting it,
+        # most recipes have none so they are left out
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                'core_recipe_image_idx ON core_recipe (image) '
+                "WHERE image <> '';",
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS '
+                        'core_recipe_image_idx;',
+        ),
+    ]
@@ -1,7 +1,11 @@
-from django.db import models
+from django.db import models, connections
+from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings
+from core.storage import ContentAddressedStorage
 import uuid
 import os
 
@@ -36,6 +40,48 @@ class UserManager(BaseUserManager):
         return user
 
 
+class UserAttrManager(models.Manager):
+
+    def bulk_get_or_create(self, user, names):
+        """Return (obj, created) for each of the user's names
+
+        Missing rows are inserted in the same statement that looks up the
+        existing ones, and the unique (user, name) constraint keeps
+        concurrent calls from creating duplicates.
+        """
+        names = list(dict.fromkeys(names))
+        table = self.model._meta.db_table
+        sql = f'''
+            WITH input (name) AS (SELECT unnest(%s::varchar[])),
+            inserted AS (
+                INSERT INTO {table} (name, user_id)
+                SELECT name, %s FROM input
+                ON CONFLICT (user_id, name) DO NOTHING
+                RETURNING id, name
+            )
+            SELECT id, name, true FROM inserted
+            UNION ALL
+            SELECT t.id, t.name, false FROM {table} t
+            JOIN input USING (name) WHERE t.user_id = %s
+        '''
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [names, user.id, user.id])
+            rows = {name: (pk, created)
+                    for pk, name, created in cursor.fetchall()}
+
+        missing = [name for name in names if name not in rows]
+        if missing:
+            # Committed by a concurrent call after the statement started
+            rows.update(
+                (name, (pk, False)) for name, pk in self.filter(
+                    user=user, name__in=missing
+                ).values_list('name', 'id')
+            )
+
+        return [(self.model(id=rows[name][0], name=name, user=user),
+                 rows[name][1]) for name in names]
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     """Custom user model that supports using email instead of username"""
 
@@ -52,8 +98,16 @@ class User(AbstractBaseUser, PermissionsMixin):
 class Tag(models.Model):
     """Tag to be used for a recipe"""
     name = models.CharField(max_length=255)
+    # Covered by the unique (user, name) index, which also serves the
+    # per-user lists ordered by name
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
-                             on_delete=models.CASCADE)
+                             on_delete=models.CASCADE,
+                             db_index=False)
+
+    objects = UserAttrManager()
+
+    class Meta:
+        unique_together = (('user', 'name'),)
 
     def __str__(self):
         return self.name
@@ -62,8 +116,16 @@ class Tag(models.Model):
 class Ingredient(models.Model):
     """Ingredient to be used in a recipe"""
     name = models.CharField(max_length=255)
+    # Covered by the unique (user, name) index, which also serves the
+    # per-user lists ordered by name
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
-                             on_delete=models.CASCADE)
+                             on_delete=models.CASCADE,
+                             db_index=False)
+
+    objects = UserAttrManager()
+
+    class Meta:
+        unique_together = (('user', 'name'),)
 
     def __str__(self):
         return self.name
@@ -71,8 +133,10 @@ class Ingredient(models.Model):
 
 class Recipe(models.Model):
     """Recipe obj"""
+    # Covered by the composite index below
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
-                             on_delete=models.CASCADE)
+                             on_delete=models.CASCADE,
+                             db_index=False)
     title = models.CharField(max_length=255, null=True, blank=True)
     time_minutes = models.IntegerField(null=True, blank=True)
     price = models.DecimalField(max_digits=5, decimal_places=2,
@@ -80,7 +144,28 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True, null=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Stored under a hash of the content, shared by recipes with equal
+    # images and deleted with the last of them, see recipe.images
+    image = models.ImageField(null=True, upload_to=recipe_image_file_path,
+                              storage=ContentAddressedStorage())
+    # Variant name -> storage name of the resized copies of the image,
+    # NULL until recipe.images has generated them
+    image_variants = JSONField(null=True, editable=False)
+    # Title, tag and ingredient names, kept up to date by the triggers
+    # created in migration 0004
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-id'],
+                         name='core_recipe_user_id_idx'),
+            models.Index(fields=['user', 'time_minutes', 'id'],
+                         name='core_recipe_user_time_idx'),
+            models.Index(fields=['user', 'price', 'id'],
+                         name='core_recipe_user_price_idx'),
+            GinIndex(fields=['search_vector'],
+                     name='core_recipe_search_idx'),
+        ]
 
     def __str__(self):
         return self.title
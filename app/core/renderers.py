@@ -0,0 +1,53 @@
+import msgpack
+import orjson
+from rest_framework import renderers
+from rest_framework.utils import encoders
+from core.timing import timed
+
+
+# Types orjson and msgpack don't know, e.g. lazy translations in error
+# messages, are encoded as DRF's JSON renderer encodes them
+_encode_default = encoders.JSONEncoder().default
+# Dates are left to DRF's encoding too, as ISO 8601 with a Z suffix
+_ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """JSON renderer encoding with orjson
+
+    The output matches DRF's compact, UTF-8 JSONRenderer output. Requests
+    for indented JSON (Accept: application/json; indent=4) are rendered
+    by DRF's renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+
+        with timed('render'):
+            content = orjson.dumps(
+                data, default=_encode_default, option=_ORJSON_OPTIONS
+            )
+        # Escaped like the standard renderer does, for embedding in
+        # JavaScript
+        return content.replace(b'\xe2\x80\xa8', b'\\u2028') \
+            .replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """Renderer for MessagePack, a compact binary equivalent of JSON"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        with timed('render'):
+            return msgpack.packb(data, default=_encode_default,
+                                 use_bin_type=True)
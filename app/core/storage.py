@@ -0,0 +1,119 @@
+import hashlib
+import os
+import uuid
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+
+
+def lock_name(name):
+    """Lock a stored name until the current transaction ends
+
+    Saving a name with the row referencing it, and checking a name has
+    no references before deleting its file, both take the lock, so the
+    file of a name a save has just returned can't be deleted before the
+    row referencing it commits. Outside a transaction the lock would end
+    with the statement, so none is taken.
+    """
+    if not connection.in_atomic_block:
+        return
+    key = int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], 'big',
+                         signed=True)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming files after the SHA-256 of their content
+
+    The directory and extension of the requested name are kept, the rest
+    becomes the hash, so saving content that is already stored returns
+    the existing name without writing a copy. Uploads hashed by
+    core.uploadhandler are not read at all in that case, other content
+    is hashed while it is written. Save a file and the row referencing
+    it in one transaction, see lock_name().
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, extension = os.path.dirname(name), \
+            os.path.splitext(name)[1].lower()
+
+        digest = getattr(content, 'content_hash', None)
+        if digest is not None:
+            name = self.hashed_name(directory, digest, extension)
+            lock_name(name)
+            if self.exists(name):
+                return name
+            temp_name = self._write_temp(directory, content)
+        else:
+            temp_name, digest = self._write_temp_hashed(directory, content)
+            name = self.hashed_name(directory, digest, extension)
+            lock_name(name)
+
+        # Replacing an existing file with the same content is harmless,
+        # so concurrent saves of one image need no file locking
+        self._move_into_place(temp_name, name)
+        return name
+
+    def save_derived(self, name, content):
+        """Store content derived from a stored file under the given name
+
+        The name is kept as is, e.g. a resized copy named after its
+        original, so concurrent writers of the same copy replace each
+        other instead of leaving copies with suffixed names.
+        """
+        temp_name = self._write_temp_hashed(os.path.dirname(name),
+                                            content)[0]
+        self._move_into_place(temp_name, name)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        """Return the name as is, equal names have equal content"""
+        return name
+
+    def hashed_name(self, directory, digest, extension):
+        """Return the name of content with the given hash"""
+        return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+    def _move_into_place(self, temp_name, name):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        os.replace(self.path(temp_name), self.path(name))
+        if self.file_permissions_mode is not None:
+            os.chmod(self.path(name), self.file_permissions_mode)
+
+    def _temp_path(self, directory):
+        temp_name = os.path.join(directory, f'.{uuid.uuid4().hex}.tmp')
+        os.makedirs(os.path.dirname(self.path(temp_name)), exist_ok=True)
+        return temp_name
+
+    def _write_temp(self, directory, content):
+        """Store content under a temporary name, moving uploads on disk"""
+        if hasattr(content, 'temporary_file_path'):
+            temp_name = self._temp_path(directory)
+            file_move_safe(content.temporary_file_path(),
+                           self.path(temp_name))
+            return temp_name
+        return self._write_temp_hashed(directory, content)[0]
+
+    def _write_temp_hashed(self, directory, content):
+        """Store content under a temporary name, hashing it on the way"""
+        temp_name = self._temp_path(directory)
+        hasher = hashlib.sha256()
+        fd = os.open(self.path(temp_name),
+                     os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    hasher.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(self.path(temp_name))
+            raise
+        return temp_name, hasher.hexdigest()
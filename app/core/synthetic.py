@@ -0,0 +1,252 @@
+import csv
+import io
+import random
+from collections import namedtuple
+
+
+FIRST_NAMES = (
+    'Alex', 'Ana', 'Ben', 'Chloe', 'Daniel', 'Elena', 'Felix', 'Grace',
+    'Hugo', 'Ines', 'Jack', 'Julia', 'Kenji', 'Lena', 'Liam', 'Maria',
+    'Mateo', 'Mia', 'Noah', 'Nora', 'Omar', 'Priya', 'Sam', 'Sofia',
+    'Tom', 'Yara', 'Zoe',
+)
+LAST_NAMES = (
+    'Berg', 'Costa', 'Dubois', 'Evans', 'Fischer', 'Garcia', 'Hansen',
+    'Ito', 'Jensen', 'Kowalski', 'Lopez', 'Martin', 'Novak', 'Okafor',
+    'Papadopoulos', 'Rossi', 'Schmidt', 'Silva', 'Smith', 'Tanaka',
+    'Walsh', 'Weber', 'Young',
+)
+# Tag and ingredient names are drawn from the same vocabularies for every
+# user, so names repeat across users as they do in real data.
+TAG_NAMES = (
+    'Breakfast', 'Brunch', 'Lunch', 'Dinner', 'Dessert', 'Snack',
+    'Starter', 'Side', 'Drink', 'Vegan', 'Vegetarian', 'Pescatarian',
+    'Gluten free', 'Dairy free', 'Low carb', 'High protein', 'Keto',
+    'Quick', 'Easy', 'One pot', 'Slow cooker', 'Make ahead', 'Freezer',
+    'Budget', 'Party', 'Kids', 'Holiday', 'Summer', 'Winter', 'Spring',
+    'Autumn', 'Comfort food', 'Healthy', 'Spicy', 'Baking', 'Grill',
+    'Salad', 'Soup', 'Pasta', 'Curry', 'Italian', 'Mexican', 'Indian',
+    'Chinese', 'Japanese', 'Thai', 'French', 'Greek', 'Middle Eastern',
+)
+INGREDIENT_BASES = (
+    'Chicken', 'Beef', 'Pork', 'Lamb', 'Salmon', 'Tuna', 'Shrimp', 'Tofu',
+    'Egg', 'Bacon', 'Rice', 'Pasta', 'Noodles', 'Bread', 'Flour', 'Oats',
+    'Quinoa', 'Lentils', 'Chickpeas', 'Black beans', 'Potato',
+    'Sweet potato', 'Carrot', 'Onion', 'Garlic', 'Ginger', 'Tomato',
+    'Bell pepper', 'Chili', 'Spinach', 'Kale', 'Broccoli', 'Cauliflower',
+    'Zucchini', 'Eggplant', 'Mushroom', 'Cucumber', 'Lettuce', 'Cabbage',
+    'Peas', 'Corn', 'Avocado', 'Lemon', 'Lime', 'Apple', 'Banana',
+    'Strawberry', 'Blueberry', 'Coconut', 'Almond', 'Walnut', 'Peanut',
+    'Cheddar', 'Parmesan', 'Mozzarella', 'Feta', 'Butter', 'Milk',
+    'Cream', 'Yogurt', 'Olive oil', 'Soy sauce', 'Honey', 'Sugar',
+    'Salt', 'Black pepper', 'Cumin', 'Paprika', 'Turmeric', 'Cinnamon',
+    'Basil', 'Parsley', 'Cilantro', 'Thyme', 'Rosemary', 'Oregano', 'Mint',
+    'Chocolate', 'Vanilla',
+)
+INGREDIENT_FORMS = ('', 'Fresh ', 'Dried ', 'Ground ', 'Smoked ', 'Chopped ')
+INGREDIENT_NAMES = tuple(f'{form}{base}' for form in INGREDIENT_FORMS
+                         for base in INGREDIENT_BASES)
+TITLE_ADJECTIVES = (
+    'Classic', 'Creamy', 'Crispy', 'Easy', 'Garlicky', 'Grilled', 'Hearty',
+    'Homemade', 'Honey', 'Lemony', 'Quick', 'Roasted', 'Rustic', 'Smoky',
+    'Spicy', 'Sticky', 'Sweet', 'Tangy', 'Warm', 'Zesty',
+)
+TITLE_DISHES = (
+    'Bake', 'Bowl', 'Burger', 'Casserole', 'Curry', 'Fritters', 'Pie',
+    'Pasta', 'Salad', 'Sandwich', 'Skewers', 'Soup', 'Stew', 'Stir fry',
+    'Tacos', 'Tart', 'Traybake', 'Wraps',
+)
+
+
+class Distribution:
+    """A distribution of counts, parsed from 'N', 'MIN-MAX' or 'exp:MEAN'
+
+    'N' is always N, 'MIN-MAX' is uniform between both inclusive and
+    'exp:MEAN[:MAX]' is exponential, most draws small and a long tail of
+    large ones, like the recipes per user of real sites.
+    """
+
+    def __init__(self, kind, low, high):
+        self.kind = kind
+        self.low = low
+        self.high = high
+
+    @classmethod
+    def parse(cls, value):
+        """Return the distribution a string describes, or raise ValueError"""
+        if value.startswith('exp:'):
+            mean, *high = value[4:].split(':', 1)
+            distribution = cls('exp', float(mean),
+                               int(high[0]) if high else None)
+            if distribution.low <= 0:
+                raise ValueError('The mean must be positive')
+        elif '-' in value:
+            low, high = value.split('-', 1)
+            distribution = cls('uniform', int(low), int(high))
+            if distribution.low > distribution.high:
+                raise ValueError('The minimum is above the maximum')
+        else:
+            distribution = cls('fixed', int(value), int(value))
+        if distribution.kind != 'exp' and distribution.low < 0:
+            raise ValueError('Counts can not be negative')
+        return distribution
+
+    def __call__(self, rng):
+        if self.kind == 'fixed':
+            return self.low
+        if self.kind == 'uniform':
+            return rng.randint(self.low, self.high)
+        count = int(rng.expovariate(1 / self.low))
+        return count if self.high is None else min(count, self.high)
+
+    def __repr__(self):
+        return f'Distribution({self.kind!r}, {self.low!r}, {self.high!r})'
+
+
+SeedConfig = namedtuple('SeedConfig', (
+    'seed', 'users', 'chunk_size', 'email_prefix', 'password', 'recipes',
+    'tags', 'ingredients', 'recipe_tags', 'recipe_ingredients',
+))
+
+
+def chunk_users(config, chunk):
+    """Return the numbers of the users in a chunk, counting from 1"""
+    first = chunk * config.chunk_size + 1
+    return range(first, min(first + config.chunk_size, config.users + 1))
+
+
+def user_email(config, number):
+    """Return the email of a user, unique to the prefix and seed"""
+    return f'{config.email_prefix}-{config.seed}-{number}@example.com'
+
+
+def generate_chunk(config, chunk):
+    """Return the users of a chunk with their tags, ingredients and recipes
+
+    Each chunk has its own random generator seeded from the config seed,
+    so a chunk is the same however many workers generate the chunks and
+    in whatever order. Recipes refer to tags and ingredients by their
+    index in the user's lists.
+    """
+    rng = random.Random(f'{config.seed}:{chunk}')
+    users = []
+    for number in chunk_users(config, chunk):
+        tags = rng.sample(TAG_NAMES, min(config.tags(rng), len(TAG_NAMES)))
+        ingredients = rng.sample(INGREDIENT_NAMES, min(
+            config.ingredients(rng), len(INGREDIENT_NAMES)
+        ))
+        recipes = []
+        for i in range(config.recipes(rng)):
+            recipe_tags = rng.sample(range(len(tags)), min(
+                config.recipe_tags(rng), len(tags)
+            ))
+            recipe_ingredients = rng.sample(range(len(ingredients)), min(
+                config.recipe_ingredients(rng), len(ingredients)
+            ))
+            main = ingredients[recipe_ingredients[0]] \
+                if recipe_ingredients else rng.choice(INGREDIENT_BASES)
+            title = f'{rng.choice(TITLE_ADJECTIVES)} {main.lower()} ' \
+                f'{rng.choice(TITLE_DISHES).lower()}'
+            link = ''
+            if rng.random() < 0.3:
+                link = 'https://example.com/recipes/' + \
+                    title.lower().replace(' ', '-')
+            recipes.append((
+                title,
+                max(1, int(rng.lognormvariate(3.3, 0.6))),
+                f'{min(rng.lognormvariate(2.3, 0.6), 999.99):.2f}',
+                link,
+                recipe_tags,
+                recipe_ingredients,
+            ))
+        users.append({
+            'email': user_email(config, number),
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'tags': tags,
+            'ingredients': ingredients,
+            'recipes': recipes,
+        })
+    return users
+
+
+def reserve_ids(cursor, table, count):
+    """Return count new ids taken from the id sequence of a table"""
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+        "FROM generate_series(1, %s)",
+        [table, count]
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Insert rows with COPY, the fastest way to load rows in PostgreSQL"""
+    buffer = io.StringIO()
+    # Quoting every string keeps empty strings apart from NULLs
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)',
+        buffer
+    )
+
+
+def insert_chunk(cursor, users, password):
+    """Insert generated users and their data, returning the row counts
+
+    Run it in a transaction. The links are copied before the recipes,
+    which the deferred foreign keys allow, so the search vector trigger
+    sees a recipe's tags and ingredients when the recipe is inserted and
+    no recipe is written twice.
+    """
+    user_ids = reserve_ids(cursor, 'core_user', len(users))
+    tags, ingredients, recipes = [], [], []
+    recipe_tags, recipe_ingredients = [], []
+    tag_ids = iter(reserve_ids(
+        cursor, 'core_tag', sum(len(user['tags']) for user in users)
+    ))
+    ingredient_ids = iter(reserve_ids(
+        cursor, 'core_ingredient',
+        sum(len(user['ingredients']) for user in users)
+    ))
+    recipe_ids = iter(reserve_ids(
+        cursor, 'core_recipe', sum(len(user['recipes']) for user in users)
+    ))
+    for user_id, user in zip(user_ids, users):
+        user_tags = [next(tag_ids) for name in user['tags']]
+        tags.extend(zip(user_tags, user['tags'], [user_id] * len(user_tags)))
+        user_ingredients = [next(ingredient_ids)
+                            for name in user['ingredients']]
+        ingredients.extend(zip(user_ingredients, user['ingredients'],
+                               [user_id] * len(user_ingredients)))
+        for title, minutes, price, link, tag_indexes, ingredient_indexes \
+                in user['recipes']:
+            recipe_id = next(recipe_ids)
+            recipes.append((recipe_id, user_id, title, minutes, price, link))
+            recipe_tags.extend((recipe_id, user_tags[i])
+                               for i in tag_indexes)
+            recipe_ingredients.extend((recipe_id, user_ingredients[i])
+                                      for i in ingredient_indexes)
+
+    copy_rows(cursor, 'core_user', (
+        'id', 'password', 'is_superuser', 'email', 'name', 'is_active',
+        'is_staff'
+    ), ((user_id, password, False, user['email'], user['name'], True, False)
+        for user_id, user in zip(user_ids, users)))
+    copy_rows(cursor, 'core_tag', ('id', 'name', 'user_id'), tags)
+    copy_rows(cursor, 'core_ingredient', ('id', 'name', 'user_id'),
+              ingredients)
+    copy_rows(cursor, 'core_recipe_tags', ('recipe_id', 'tag_id'),
+              recipe_tags)
+    copy_rows(cursor, 'core_recipe_ingredients',
+              ('recipe_id', 'ingredient_id'), recipe_ingredients)
+    copy_rows(cursor, 'core_recipe', (
+        'id', 'user_id', 'title', 'time_minutes', 'price', 'link'
+    ), recipes)
+    return {
+        'users': len(users),
+        'tags': len(tags),
+        'ingredients': len(ingredients),
+        'recipes': len(recipes),
+        'links': len(recipe_tags) + len(recipe_ingredients),
+    }
@@ -1,7 +1,20 @@
-from unittest.mock import patch
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import MagicMock, patch
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
 from django.db.utils import OperationalError
 from django.test import TestCase
+from PIL import Image
+from core import models, synthetic
+from core.management.commands import bench
 
 
 class CommandTests(TestCase):
@@ -9,14 +22,304 @@ class CommandTests(TestCase):
     def test_wait_for_db_ready(self):
         """Test waiting for db when db is available"""
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1)
+            call_command('wait_for_db', stdout=StringIO())
+            cursor = gi.return_value.cursor.return_value.__enter__()
+            cursor.execute.assert_called_once_with('SELECT 1')
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
-        """Test waiting for db"""
+        """Test waiting for db with growing delays"""
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+            gi.return_value.cursor.side_effect = \
+                [OperationalError] * 5 + [MagicMock()]
+            call_command('wait_for_db', stdout=StringIO())
+            self.assertEqual(gi.return_value.cursor.call_count, 6)
+        self.assertEqual([call[0][0] for call in ts.call_args_list],
+                         [0.5, 1, 2, 4, 5])
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_reconnects_after_failed_query(self, ts):
+        """Test a connection failing the query is closed before retrying"""
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            cursor = gi.return_value.cursor.return_value.__enter__()
+            cursor.execute.side_effect = [OperationalError, None]
+            call_command('wait_for_db', stdout=StringIO())
+            gi.return_value.close.assert_called_once_with()
+        self.assertEqual(cursor.execute.call_count, 2)
+
+    @patch('time.sleep', return_value=True)
+    @patch('time.monotonic', side_effect=[0, 10, 70])
+    def test_wait_for_db_timeout(self, tm, ts):
+        """Test giving up once the timeout has passed"""
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.return_value.cursor.side_effect = OperationalError
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=60, stdout=StringIO())
+        self.assertEqual(ts.call_count, 1)
+
+    def test_explain_queries_seeds_and_reports_scans(self):
+        """Test explaining the API queries on a seeded dataset"""
+        out = StringIO()
+        call_command('explain_queries', seed_users=2, recipes_per_user=4,
+                     tags_per_user=3, ingredients_per_user=3, stdout=out)
+
+        self.assertEqual(models.Recipe.objects.count(), 8)
+        self.assertEqual(models.Recipe.tags.through.objects.count(), 24)
+        self.assertIn('Recipe list by tags', out.getvalue())
+        self.assertIn('Recipe filter by tags (all)', out.getvalue())
+        self.assertIn('Same plan for every size', out.getvalue())
+        self.assertIn('sequential scan(s) found', out.getvalue())
+        # The list is explained as rows, with their tag ids subquery
+        recipe_list = out.getvalue().split('Recipe list\n')[1] \
+            .split('Recipe search')[0]
+        self.assertIn('on core_recipe_tags', recipe_list)
+
+    def test_generate_image_variants(self):
+        """Test generating the variants of images that have none"""
+        user = get_user_model().objects.create_user('test@gmail.com',
+                                                    '1qazxsw2')
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30)).save(buffer, format='JPEG')
+        name = default_storage.save('uploads/recipe/test.jpg',
+                                    ContentFile(buffer.getvalue()))
+        self.addCleanup(default_storage.delete, name)
+        recipe = models.Recipe.objects.create(user=user, title='Soup',
+                                              image=name)
+        models.Recipe.objects.create(user=user, title='No image')
+
+        out = StringIO()
+        call_command('generate_image_variants', stdout=out)
+
+        recipe.refresh_from_db()
+        for variant in recipe.image_variants.values():
+            self.addCleanup(default_storage.delete, variant)
+            self.assertTrue(default_storage.exists(variant))
+        self.assertEqual(len(recipe.image_variants), 3)
+        self.assertIn('Generated variants of 1 images', out.getvalue())
+
+    def test_generate_image_variants_all(self):
+        """Test --all regenerates the variants that already exist"""
+        user = get_user_model().objects.create_user('test@gmail.com',
+                                                    '1qazxsw2')
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30)).save(buffer, format='JPEG')
+        name = default_storage.save('uploads/recipe/test.jpg',
+                                    ContentFile(buffer.getvalue()))
+        self.addCleanup(default_storage.delete, name)
+        recipe = models.Recipe.objects.create(user=user, title='Soup',
+                                              image=name)
+        call_command('generate_image_variants', stdout=StringIO())
+        recipe.refresh_from_db()
+        for variant in recipe.image_variants.values():
+            self.addCleanup(default_storage.delete, variant)
+        thumbnail = recipe.image_variants['thumbnail']
+        with default_storage.open(thumbnail, 'wb') as f:
+            f.write(b'stale')
+
+        call_command('generate_image_variants', all=True, stdout=StringIO())
+
+        with default_storage.open(thumbnail) as f:
+            self.assertEqual(Image.open(f).size, (40, 30))
+
+    def test_bench_serializers(self):
+        """Test both recipe list paths are timed and render the same"""
+        call_command('explain_queries', seed_users=1, recipes_per_user=5,
+                     tags_per_user=3, ingredients_per_user=3,
+                     filter_sizes='', stdout=StringIO())
+
+        out = StringIO()
+        call_command('bench_serializers', repeat=1, stdout=out)
+
+        self.assertIn('Rendering 5 recipes', out.getvalue())
+        self.assertIn('us per recipe', out.getvalue())
+        self.assertIn('Same output', out.getvalue())
+
+    def test_bench_endpoints(self):
+        """Test every endpoint is benchmarked and results can be compared"""
+        output = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        self.addCleanup(os.remove, output)
+        out = StringIO()
+        call_command('bench', seed_users=2, recipes_per_user=3,
+                     tags_per_user=3, ingredients_per_user=3, requests=2,
+                     warmup=0, output=output, stdout=out)
+
+        with open(output) as f:
+            endpoints = json.load(f)['endpoints']
+        self.assertIn('user token', endpoints)
+        for summary in endpoints.values():
+            self.assertEqual(summary['requests'], 2)
+            self.assertEqual(summary['errors'], 0)
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+        self.assertGreaterEqual(
+            endpoints['recipes list']['queries_per_request'], 1
+        )
+        self.assertEqual(endpoints['recipe create']['errors'], 0)
+        self.assertFalse(models.Recipe.objects.filter(
+            title=bench.CREATED_TITLE).exists())
+        users = bench.Command()._bench_users(2)
+        self.assertEqual(len({user['id'] for user in users}), 2)
+
+        out = StringIO()
+        call_command('bench', requests=2, endpoint=['recipes list'],
+                     baseline=output, stdout=out)
+        self.assertIn('recipes list: p50_ms', out.getvalue())
+
+    def test_bench_connections(self):
+        """Test pooled and unpooled request latency are both reported"""
+        out = StringIO()
+        call_command('bench_connections', requests=3, threads=2, stdout=out)
+
+        self.assertIn('Unpooled: mean', out.getvalue())
+        self.assertIn('Pooled: mean', out.getvalue())
+
+    def test_seed_data(self):
+        """Test seeding users with linked data and a shared password"""
+        out = StringIO()
+        call_command('seed_data', '--users=5', '--chunk-size=2',
+                     '--recipes-per-user=exp:4:10', '--tags-per-user=2-5',
+                     '--tags-per-recipe=1-2', '--seed=7', stdout=out)
+
+        users = get_user_model().objects.filter(email__startswith='synthetic')
+        self.assertEqual(users.count(), 5)
+        self.assertTrue(users.get(email='synthetic-7-5@example.com')
+                        .check_password('password'))
+        self.assertEqual(len({user.password for user in users}), 1)
+        self.assertFalse(models.Recipe.objects.filter(tags=None).exists())
+        self.assertFalse(models.Recipe.objects.exclude(
+            tags__user=F('user')).exists())
+        # Tag names are in the search vector, with weight B
+        for vector in models.Recipe.objects.values_list('search_vector',
+                                                        flat=True):
+            self.assertRegex(vector, r'\d+B')
+        self.assertIn('Seeded 5 users', out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('seed_data', '--users=1', '--seed=7',
+                         stdout=StringIO())
+
+    def test_seed_data_is_deterministic(self):
+        """Test a chunk generates the same data for the same seed"""
+        config = synthetic.SeedConfig(
+            seed=1, users=10, chunk_size=4, email_prefix='test',
+            password='!', recipes=synthetic.Distribution.parse('exp:5'),
+            tags=synthetic.Distribution.parse('3'),
+            ingredients=synthetic.Distribution.parse('5-10'),
+            recipe_tags=synthetic.Distribution.parse('0-3'),
+            recipe_ingredients=synthetic.Distribution.parse('1-5'),
+        )
+
+        chunk = synthetic.generate_chunk(config, 1)
+        self.assertEqual(synthetic.generate_chunk(config, 1), chunk)
+        self.assertNotEqual(synthetic.generate_chunk(config, 0), chunk)
+        self.assertEqual(len(synthetic.generate_chunk(config, 2)), 2)
+        self.assertNotEqual(
+            synthetic.generate_chunk(config._replace(seed=2), 1), chunk
+        )
+
+
+class ImportRecipesTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@gmail.com', '1qazxsw2')
+        self.tag = models.Tag.objects.create(user=self.user, name='Vegan')
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_import_ndjson_recipes(self):
+        """Test importing recipes and resolving names to ids"""
+        path = self._write('recipes.ndjson', '\n'.join(json.dumps(r) for r in [
+            {'title': 'Soup', 'time_minutes': 20, 'price': '4.50',
+             'tags': ['Vegan', 'Dinner'], 'ingredients': ['Leek']},
+            {'title': 'Salad\twith tab', 'tags': ['Dinner']},
+            {'title': 'Stew', 'price': None, 'ingredients': ['Leek']},
+        ]))
+        out = StringIO()
+
+        call_command('import_recipes', path, email=self.user.email,
+                     batch_size=2, stdout=out)
+
+        recipes = models.Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual([r.title for r in recipes],
+                         ['Soup', 'Salad\twith tab', 'Stew'])
+        self.assertEqual(recipes[0].price, Decimal('4.50'))
+        self.assertEqual(set(recipes[0].tags.values_list('name', flat=True)),
+                         {'Vegan', 'Dinner'})
+        self.assertIn(self.tag, recipes[0].tags.all())
+        self.assertEqual(models.Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(
+            models.Ingredient.objects.get(user=self.user).recipe_set.count(),
+            2)
+        self.assertIn('Imported 3 recipes, 5 links', out.getvalue())
+
+        with open(f'{path}.checkpoint') as f:
+            self.assertEqual(f.read(), '3')
+
+    def test_import_csv_resumes_from_checkpoint(self):
+        """Test records before the checkpoint are skipped"""
+        path = self._write('recipes.csv',
+                           'title,time_minutes,price,link,tags,ingredients\n'
+                           'Soup,20,4.50,,Vegan|Dinner,Leek\n'
+                           'Salad,5,,,,Lettuce\n')
+        self._write('recipes.csv.checkpoint', '1')
+
+        call_command('import_recipes', path, email=self.user.email,
+                     stdout=StringIO())
+
+        recipe = models.Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.title, 'Salad')
+        self.assertIsNone(recipe.price)
+        self.assertEqual(list(recipe.ingredients.values_list('name',
+                                                             flat=True)),
+                         ['Lettuce'])
+
+    def test_import_rejects_values_the_columns_cant_hold(self):
+        """Test values beyond the model field limits are reported"""
+        for record in ({'title': 'x' * 256}, {'price': '1234.5'},
+                       {'price': '4.505'}, {'time_minutes': 2 ** 31},
+                       {'title': 'Soup', 'tags': ['x' * 256]}):
+            path = self._write('recipes.ndjson', json.dumps(record))
+            with self.assertRaisesRegex(CommandError, 'Record 1 is invalid'):
+                call_command('import_recipes', path, email=self.user.email,
+                             restart=True, stdout=StringIO())
+        self.assertFalse(models.Recipe.objects.exists())
+
+    def test_import_rejects_malformed_lines(self):
+        """Test lines that aren't JSON objects are reported by number"""
+        for line in ('{"title": "Soup"', '["Soup"]', 'null'):
+            path = self._write('recipes.ndjson',
+                               '{"title": "Salad"}\n\n' + line)
+            with self.assertRaisesRegex(CommandError,
+                                        'Record 2 is invalid: line 3'):
+                call_command('import_recipes', path, email=self.user.email,
+                             restart=True, stdout=StringIO())
+
+    def test_import_resumes_after_a_pending_batch(self):
+        """Test a batch committed before its checkpoint is not reimported"""
+        path = self._write('recipes.ndjson', '\n'.join(
+            json.dumps({'title': title}) for title in ('Soup', 'Salad', 'Stew')
+        ))
+        committed = models.Recipe.objects.create(user=self.user, title='Soup')
+        self._write('recipes.ndjson.checkpoint', f'0 1 {committed.id}')
+
+        call_command('import_recipes', path, email=self.user.email,
+                     stdout=StringIO())
+
+        self.assertEqual(sorted(models.Recipe.objects.values_list(
+            'title', flat=True)), ['Salad', 'Soup', 'Stew'])
+
+        models.Recipe.objects.all().delete()
+        self._write('recipes.ndjson.checkpoint', f'1 2 {committed.id}')
+        call_command('import_recipes', path, email=self.user.email,
+                     stdout=StringIO())
+
+        self.assertEqual(sorted(models.Recipe.objects.values_list(
+            'title', flat=True)), ['Salad', 'Stew'])
@@ -0,0 +1,84 @@
+import gc
+import psycopg2
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import SimpleTestCase
+from core.db.pool import ConnectionPool
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        params = connection.get_connection_params()
+        self.connect = lambda: psycopg2.connect(**params)
+        self.pool = ConnectionPool(self.connect, size=2, timeout=0.01,
+                                   check_after=0)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_reuse_and_limit_connections(self):
+        """Test returned connections are reused and the size is enforced"""
+        first = self.pool.get()
+        second = self.pool.get()
+        with self.assertRaises(psycopg2.OperationalError):
+            self.pool.get()
+
+        self.pool.put(first)
+        self.assertIs(self.pool.get(), first)
+        self.pool.put(first)
+        self.pool.put(second)
+
+    def test_replace_broken_connections(self):
+        """Test a connection closed by the server isn't handed out"""
+        broken = self.pool.get()
+        pid = broken.get_backend_pid()
+        self.pool.put(broken)
+        with self.connect() as admin, admin.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        admin.close()
+
+        with self.assertLogs('core.db.pool', 'WARNING'):
+            healthy = self.pool.get()
+        self.assertIsNot(healthy, broken)
+        with healthy.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.pool.put(healthy)
+
+    def test_return_rolls_back_or_closes(self):
+        """Test open transactions are rolled back and lost places freed"""
+        borrowed = self.pool.get()
+        with borrowed.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        self.pool.put(borrowed)
+        self.assertEqual(borrowed.get_transaction_status(),
+                         psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+
+        self.pool.put(self.pool.get(), close=True)
+        self.assertTrue(borrowed.closed)
+
+        self.pool.get()
+        lost = self.pool.get()
+        del lost
+        gc.collect()
+        self.pool.put(self.pool.get())
+
+
+class PooledBackendTests(SimpleTestCase):
+
+    def test_close_returns_connection_to_pool(self):
+        """Test Django closing the connection keeps it for the next one"""
+        backend = load_backend('core.db')
+        wrapper = backend.DatabaseWrapper(dict(connection.settings_dict))
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+
+        self.assertFalse(raw.closed)
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, raw)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        wrapper.close()
+        wrapper.pool.close()
+        self.assertTrue(raw.closed)
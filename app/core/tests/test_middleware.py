@@ -0,0 +1,139 @@
+import gzip
+import zlib
+from unittest.mock import patch
+import brotli
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, \
+    override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core import models
+from core.middleware import CompressionMiddleware, accepted_encoding
+
+
+BODY = b'{"title": "Recipe"}' * 100
+
+
+def respond(path='/api/recipe/recipes/', accept='gzip, deflate, br',
+            response=None, **extra):
+    """Return a response passed through the middleware"""
+    request = RequestFactory().get(path, HTTP_ACCEPT_ENCODING=accept,
+                                   **extra)
+    if response is None:
+        response = HttpResponse(BODY, content_type='application/json')
+    return CompressionMiddleware(lambda request: response)(request)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024,
+                   COMPRESSION_CONTENT_TYPES=('application/json',
+                                              'application/x-ndjson'))
+class CompressionMiddlewareTests(SimpleTestCase):
+
+    def test_accepted_encoding(self):
+        """Test brotli is preferred unless weighted lower or refused"""
+        for header, expected in (('gzip, deflate, br', 'br'),
+                                 ('gzip', 'gzip'),
+                                 ('br;q=0.5, gzip', 'gzip'),
+                                 ('br;q=0, *', 'gzip'),
+                                 ('identity', None),
+                                 ('gzip;q=0', None),
+                                 ('', None)):
+            self.assertEqual(accepted_encoding(header), expected, header)
+
+    def test_compress_brotli_and_gzip(self):
+        """Test responses are compressed as the client accepts"""
+        res = respond()
+        self.assertEqual(res['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(res.content), BODY)
+        self.assertEqual(res['Content-Length'], str(len(res.content)))
+        self.assertIn('Accept-Encoding', res['Vary'])
+
+        res = respond(accept='gzip')
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), BODY)
+
+    def test_compress_streaming_response(self):
+        """Test streaming responses are compressed as they are sent"""
+        response = StreamingHttpResponse(
+            (b'{"id": %d}\n' % i for i in range(1000)),
+            content_type='application/x-ndjson'
+        )
+
+        res = respond(response=response, accept='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertFalse(res.has_header('Content-Length'))
+        content = gzip.decompress(b''.join(res.streaming_content))
+        self.assertEqual(content.count(b'\n'), 1000)
+
+    def test_flush_streaming_response(self):
+        """Test the first chunk is sent at once, not held by the encoder"""
+        for accept, decompress in (
+                ('gzip', zlib.decompressobj(16 + zlib.MAX_WBITS).decompress),
+                ('br', brotli.Decompressor().process)):
+            response = StreamingHttpResponse(
+                (b'{"id": %d}\n' % i for i in range(1000)),
+                content_type='application/x-ndjson'
+            )
+            res = respond(response=response, accept=accept)
+
+            first = next(iter(res.streaming_content))
+            self.assertEqual(decompress(first), b'{"id": 0}\n')
+
+    def test_weaken_etag(self):
+        """Test a compressed response no longer has a strong ETag"""
+        response = HttpResponse(BODY, content_type='application/json')
+        response['ETag'] = '"abc"'
+
+        self.assertEqual(respond(response=response)['ETag'], 'W/"abc"')
+
+    def test_skip_small_media_and_other_types(self):
+        """Test what isn't worth compressing is sent as is"""
+        small = HttpResponse(b'{}', content_type='application/json')
+        image = HttpResponse(BODY, content_type='image/jpeg')
+        media = HttpResponse(BODY, content_type='application/json')
+        for res in (respond(response=small),
+                    respond(response=image),
+                    respond('/media/uploads/recipe/a.json', response=media),
+                    respond(accept='identity'),
+                    respond(CSRF_COOKIE_USED=True)):
+            self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(media.content, BODY)
+
+
+@override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+class ServerTimingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('test@gmail.com',
+                                                    '1qazxsw2')
+        models.Recipe.objects.create(user=user, title='Soup')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}'
+        )
+
+    def test_report_timings(self):
+        """Test sampled requests report their SQL and serializer time"""
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            res = self.client.get('/api/recipe/recipes/')
+
+        timings = res['Server-Timing']
+        for name in ('auth', 'sql', 'serialize', 'render', 'total'):
+            self.assertIn(f'{name};dur=', timings)
+        self.assertIn('desc="2 queries"', timings)
+        self.assertIn('GET /api/recipe/recipes/ 200 queries=2',
+                      logs.output[0])
+        self.assertEqual(logs.records[0].timings['queries'], 2)
+
+    def test_unsampled_requests(self):
+        """Test requests outside the sample aren't timed"""
+        with patch('random.random', return_value=0.5), \
+                self.settings(SERVER_TIMING_SAMPLE_RATE=0.1):
+            res = APIClient().get('/api/recipe/recipes/')
+        self.assertFalse(res.has_header('Server-Timing'))
+
+        with self.settings(SERVER_TIMING_SAMPLE_RATE=0):
+            res = APIClient().get('/api/recipe/recipes/')
+        self.assertFalse(res.has_header('Server-Timing'))
@@ -0,0 +1,66 @@
+import datetime
+import io
+from collections import OrderedDict
+from decimal import Decimal
+import msgpack
+from django.test import SimpleTestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from core.parsers import MessagePackParser, ORJSONParser
+from core.renderers import MessagePackRenderer, ORJSONRenderer
+
+
+DATA = OrderedDict([
+    ('id', 1),
+    ('title', 'Crème brûlée\u2028'),
+    ('price', '5.50'),
+    ('cost', Decimal('5.50')),
+    ('image', 'http://testserver/media/uploads/recipe/ab/ab12.jpg'),
+    ('tags', [1, 2]),
+    ('created', datetime.datetime(2020, 1, 2, 3, 4, 5, 678000,
+                                  tzinfo=timezone.utc)),
+    ('error', gettext_lazy('This field is required.')),
+    ('nothing', None),
+])
+
+
+class RendererTests(SimpleTestCase):
+
+    def test_orjson_renders_like_drf(self):
+        """Test the fast JSON renderer output matches DRF's"""
+        self.assertEqual(ORJSONRenderer().render(DATA),
+                         JSONRenderer().render(DATA))
+
+    def test_orjson_indent_falls_back_to_drf(self):
+        """Test indented JSON is still available"""
+        content = ORJSONRenderer().render(
+            DATA, 'application/json; indent=2'
+        )
+
+        self.assertEqual(content, JSONRenderer().render(
+            DATA, 'application/json; indent=2'
+        ))
+        self.assertIn(b'\n  "id": 1', content)
+
+    def test_msgpack_round_trip(self):
+        """Test MessagePack renders what JSON would and parses it back"""
+        content = MessagePackRenderer().render(DATA)
+
+        parsed = MessagePackParser().parse(io.BytesIO(content))
+        self.assertEqual(parsed['price'], '5.50')
+        self.assertEqual(parsed['cost'], 5.5)
+        self.assertEqual(parsed['created'], '2020-01-02T03:04:05.678000Z')
+        self.assertEqual(parsed['error'], 'This field is required.')
+        self.assertEqual(list(parsed), list(DATA))
+        self.assertEqual(msgpack.unpackb(content, raw=False), parsed)
+
+    def test_parsers_reject_malformed_bodies(self):
+        """Test invalid bodies are parse errors"""
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"price": NaN}'))
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(io.BytesIO(b'\xc1'))
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(b'{"a": [1]}')),
+                         {'a': [1]})
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import tempfile
+from unittest.mock import Mock
+from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.test import SimpleTestCase
+from core.storage import ContentAddressedStorage
+from core.uploadhandler import HashingMemoryFileUploadHandler, \
+                               HashingTemporaryFileUploadHandler
+
+
+class StorageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.storage = ContentAddressedStorage(location=self.dir.name)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_save_names_files_by_content_hash(self):
+        """Test equal content is stored once under its hash"""
+        digest = hashlib.sha256(b'image').hexdigest()
+
+        first = self.storage.save('uploads/a.JPG', ContentFile(b'image'))
+        second = self.storage.save('uploads/b.jpg', ContentFile(b'image'))
+        other = self.storage.save('uploads/c.jpg', ContentFile(b'other'))
+
+        self.assertEqual(first, f'uploads/{digest[:2]}/{digest}.jpg')
+        self.assertEqual(second, first)
+        self.assertNotEqual(other, first)
+        with self.storage.open(first) as f:
+            self.assertEqual(f.read(), b'image')
+        stored = [name for root, dirs, files in os.walk(self.dir.name)
+                  for name in files]
+        self.assertEqual(len(stored), 2)
+
+    def test_save_derived_keeps_the_name(self):
+        """Test a derived file replaces one of the same name"""
+        first = self.storage.save_derived('uploads/ab-thumbnail.jpg',
+                                          ContentFile(b'small'))
+        second = self.storage.save_derived('uploads/ab-thumbnail.jpg',
+                                           ContentFile(b'small'))
+
+        self.assertEqual(first, 'uploads/ab-thumbnail.jpg')
+        self.assertEqual(second, first)
+        self.assertEqual(os.listdir(os.path.join(self.dir.name, 'uploads')),
+                         ['ab-thumbnail.jpg'])
+
+    def test_save_hashed_upload_skips_stored_content(self):
+        """Test an upload hashed on arrival isn't read if already stored"""
+        name = self.storage.save('uploads/a.jpg', ContentFile(b'image'))
+        upload = Mock(content_hash=hashlib.sha256(b'image').hexdigest())
+
+        self.assertEqual(self.storage.save('uploads/b.jpg', upload), name)
+        upload.chunks.assert_not_called()
+
+    def test_upload_handlers_hash_while_receiving(self):
+        """Test both upload handlers set the hash of what they stored"""
+        data = b'x' * 100
+        for handler_class in (HashingMemoryFileUploadHandler,
+                              HashingTemporaryFileUploadHandler):
+            handler = handler_class()
+            handler.handle_raw_input(None, {}, len(data), None)
+            try:
+                handler.new_file('image', 'a.jpg', 'image/jpeg', len(data))
+            except StopFutureHandlers:
+                pass
+            for start in range(0, len(data), 30):
+                handler.receive_data_chunk(data[start:start + 30], start)
+            upload = handler.file_complete(len(data))
+
+            self.assertEqual(upload.content_hash,
+                             hashlib.sha256(data).hexdigest())
@@ -0,0 +1,158 @@
+import hashlib
+import os
+import tempfile
+from unittest.mock import patch
+from django.core.cache import caches
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from core.views import check_cache
+
+
+def media_url(name):
+    """Return the URL serving a media file"""
+    return reverse('media', args=[name])
+
+
+class MediaViewTests(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.dir.name,
+                                          MEDIA_SENDFILE='')
+        self.override.enable()
+        digest = hashlib.sha256(b'0123456789').hexdigest()
+        self.name = f'uploads/recipe/{digest[:2]}/{digest}.jpg'
+        self._write(self.name, b'0123456789')
+
+    def tearDown(self):
+        self.override.disable()
+        self.dir.cleanup()
+
+    def _write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def test_serve_content_addressed_file(self):
+        """Test hashed names are cached as immutable"""
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), b'0123456789')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', res['Cache-Control'])
+
+        res = self.client.get(media_url(self.name),
+                              HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, 304)
+
+    def test_serve_other_file_not_immutable(self):
+        """Test other names are cached for a short time only"""
+        self._write('uploads/recipe/photo.jpg', b'data')
+
+        res = self.client.get(media_url('uploads/recipe/photo.jpg'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('immutable', res['Cache-Control'])
+
+    def test_serve_byte_ranges(self):
+        """Test single byte ranges are answered with partial content"""
+        for header, body, content_range in (
+                ('bytes=2-4', b'234', 'bytes 2-4/10'),
+                ('bytes=7-', b'789', 'bytes 7-9/10'),
+                ('bytes=-2', b'89', 'bytes 8-9/10'),
+                ('bytes=5-100', b'56789', 'bytes 5-9/10')):
+            res = self.client.get(media_url(self.name), HTTP_RANGE=header)
+            self.assertEqual(res.status_code, 206)
+            self.assertEqual(b''.join(res.streaming_content), body)
+            self.assertEqual(res['Content-Range'], content_range)
+
+        res = self.client.get(media_url(self.name), HTTP_RANGE='bytes=10-')
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], 'bytes */10')
+
+        res = self.client.get(media_url(self.name), HTTP_RANGE='bytes=2-4',
+                              HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(res.status_code, 200)
+
+    def test_sendfile_offload(self):
+        """Test the web server is told to send the file"""
+        with self.settings(MEDIA_SENDFILE='nginx',
+                           MEDIA_SENDFILE_PREFIX='/protected-media/'):
+            res = self.client.get(media_url(self.name))
+        self.assertEqual(res['X-Accel-Redirect'],
+                         f'/protected-media/{self.name}')
+        self.assertEqual(res.content, b'')
+        self.assertIn('immutable', res['Cache-Control'])
+
+        with self.settings(MEDIA_SENDFILE='apache'):
+            res = self.client.get(media_url(self.name))
+        self.assertEqual(res['X-Sendfile'],
+                         os.path.join(self.dir.name, self.name))
+
+    def test_serve_missing_or_outside_files(self):
+        """Test missing files and paths outside MEDIA_ROOT are not found"""
+        for name in ('uploads/missing.jpg', 'uploads', '../etc/passwd',
+                     'uploads/../../etc/passwd'):
+            res = self.client.get(media_url(name))
+            self.assertEqual(res.status_code, 404)
+
+        res = self.client.post(media_url(self.name))
+        self.assertEqual(res.status_code, 405)
+
+
+class HealthzTests(TestCase):
+
+    def test_healthy(self):
+        """Test the database and cache latency are reported"""
+        res = self.client.get(reverse('healthz'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['status'], 'ok')
+        for check in ('database', 'cache'):
+            self.assertTrue(res.json()[check]['ok'])
+            self.assertGreaterEqual(res.json()[check]['latency_ms'], 0)
+        self.assertIn('no-cache', res['Cache-Control'])
+
+    def test_unavailable_dependencies(self):
+        """Test a failing database or cache makes the node unavailable"""
+        with patch('core.views.check_database',
+                   side_effect=OperationalError('connection refused')):
+            res = self.client.get(reverse('healthz'))
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['database']['error'],
+                         'connection refused')
+        self.assertTrue(res.json()['cache']['ok'])
+
+        with patch('core.views.check_cache',
+                   side_effect=ValueError('The cache lost the value')):
+            res = self.client.get(reverse('healthz'))
+        self.assertEqual(res.status_code, 503)
+        self.assertFalse(res.json()['cache']['ok'])
+
+    def test_cache_check_cleans_up(self):
+        """Test each cache check uses its own key and deletes it"""
+        cache = caches['default']
+        with patch.object(cache, 'set', wraps=cache.set) as set_, \
+                patch.object(cache, 'delete', wraps=cache.delete) as delete:
+            check_cache()
+            check_cache()
+
+        keys = [args[0] for args, kwargs in set_.call_args_list]
+        self.assertEqual(len(set(keys)), 2)
+        self.assertEqual([args[0] for args, kwargs in
+                          delete.call_args_list], keys)
+        for key in keys:
+            self.assertIsNone(cache.get(key))
+
+    @override_settings(HEALTHZ_MAX_DB_LATENCY_MS=-1)
+    def test_slow_database(self):
+        """Test a slow database round trip makes the node unavailable"""
+        res = self.client.get(reverse('healthz'))
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['status'], 'unavailable')
+        self.assertIn('Slower than', res.json()['database']['error'])
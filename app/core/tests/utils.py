@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def capture_on_commit_callbacks(using=DEFAULT_DB_ALIAS, execute=False):
+    """Collect the on_commit() callbacks registered in the block
+
+    TestCase never commits, so the callbacks would never run. With
+    execute they are run as the block exits, as on a commit. A backport
+    of TestCase.captureOnCommitCallbacks() from Django 3.2.
+    """
+    callbacks = []
+    start = len(connections[using].run_on_commit)
+    try:
+        yield callbacks
+    finally:
+        callbacks[:] = [func for sids, func in
+                        connections[using].run_on_commit[start:]]
+        del connections[using].run_on_commit[start:]
+        if execute:
+            for callback in callbacks:
+                callback()
@@ -0,0 +1,51 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+_local = threading.local()
+
+
+class Timings:
+    """Durations in seconds and the SQL query count of one request"""
+
+    def __init__(self):
+        self.durations = OrderedDict()
+        self.queries = 0
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0) + seconds
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Count and time queries, see connection.execute_wrapper()"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add('sql', time.perf_counter() - started)
+
+
+@contextmanager
+def recording():
+    """Record the timings of the code run in the block in this thread"""
+    timings = _local.timings = Timings()
+    try:
+        yield timings
+    finally:
+        _local.timings = None
+
+
+@contextmanager
+def timed(name):
+    """Add the time the block takes to the recorded timings, if any"""
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
@@ -0,0 +1,40 @@
+import hashlib
+from django.core.files.uploadhandler import MemoryFileUploadHandler, \
+                                           TemporaryFileUploadHandler
+
+
+class HashingUploadMixin:
+    """Hash the chunks an upload handler stores as they stream in
+
+    The hex SHA-256 is set as content_hash on the uploaded file, for
+    core.storage.ContentAddressedStorage to name it without reading it
+    back.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Set first, the memory handler stops the others by raising
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # Handlers return the chunks they don't store to the next one
+        passed_on = super().receive_data_chunk(raw_data, start)
+        if passed_on is None:
+            self.hasher.update(raw_data)
+        return passed_on
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin,
+                                     MemoryFileUploadHandler):
+    """Keep small uploads in memory, hashing them"""
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin,
+                                        TemporaryFileUploadHandler):
+    """Stream large uploads to a temporary file, hashing them"""
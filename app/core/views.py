@@ -0,0 +1,213 @@
+import mimetypes
+import os
+import posixpath
+import re
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import DatabaseError, connections
+from django.http import FileResponse, Http404, HttpResponse, \
+    JsonResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+
+# Files named by core.storage.ContentAddressedStorage, and their variants,
+# never change
+CONTENT_ADDRESSED_NAME = re.compile(r'(^|/)[0-9a-f]{64}(-\w+)?\.\w+$')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = 60 * 60
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """Return the (start, end) of a single byte range, end included
+
+    Returns None for no or unsupported ranges, which are answered with
+    the whole file, and raises ValueError for unsatisfiable ones.
+    """
+    match = RANGE.match(header or '')
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # A suffix range, the last N bytes
+        if not int(last) or not size:
+            raise ValueError('Empty range')
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError('Range starts after the end of the file')
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def read_range(path, start, length):
+    """Yield length bytes of a file from start"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def sendfile_response(name, path):
+    """Return an empty response telling the web server to send a file
+
+    nginx reads the file from an internal location, Apache's mod_xsendfile
+    from its path. Either serves ranges and conditional requests itself.
+    """
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE == 'nginx':
+        response['X-Accel-Redirect'] = \
+            settings.MEDIA_SENDFILE_PREFIX + name
+    else:
+        response['X-Sendfile'] = path
+    # Let the web server set the type from the file
+    del response['Content-Type']
+    return response
+
+
+def file_response(range_header, path, size):
+    """Stream a file or the requested range of it"""
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(path, start, end - start + 1),
+            status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve an uploaded file from MEDIA_ROOT
+
+    Content addressed files are cached for a year as immutable. With
+    MEDIA_SENDFILE set the front web server delivers the file, so no
+    worker is tied up by the transfer.
+    """
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404('File not found')
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    immutable = CONTENT_ADDRESSED_NAME.search(name) is not None
+    etag = quote_etag(f'{int(stat.st_mtime)}-{stat.st_size}')
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is None:
+        range_header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and if_range not in (etag, http_date(stat.st_mtime)):
+            # The client's copy is outdated, send the whole file
+            range_header = None
+        if settings.MEDIA_SENDFILE:
+            response = sendfile_response(name, full_path)
+        else:
+            response = file_response(range_header, full_path,
+                                     stat.st_size)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if immutable:
+        response['Cache-Control'] = \
+            f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={MUTABLE_MAX_AGE}'
+    return response
+
+
+def check_database(alias='default'):
+    """Return the round trip time of a query in ms, raising if it fails"""
+    started = time.perf_counter()
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return (time.perf_counter() - started) * 1000
+
+
+def check_cache(alias='default'):
+    """Return the time to write and read back a value in ms
+
+    Raises ValueError if the value isn't read back, some cache backends
+    ignore their errors. Each check uses its own key, so concurrent
+    checks sharing the cache can't read each other's values.
+    """
+    started = time.perf_counter()
+    cache = caches[alias]
+    value = uuid.uuid4().hex
+    key = f'healthz:{value}'
+    cache.set(key, value, 10)
+    try:
+        if cache.get(key) != value:
+            raise ValueError('The cache lost the value')
+    finally:
+        cache.delete(key)
+    return (time.perf_counter() - started) * 1000
+
+
+@never_cache
+@require_safe
+def healthz(request):
+    """Report the database and cache latency for load balancer checks
+
+    Answers 503 when either is unavailable or the database round trip
+    takes longer than HEALTHZ_MAX_DB_LATENCY_MS, so traffic is routed to
+    other workers.
+    """
+    healthy = True
+    checks = {}
+    for name, check in (('database', check_database),
+                        ('cache', check_cache)):
+        try:
+            latency = check()
+        except (DatabaseError, ValueError, OSError) as exc:
+            healthy = False
+            checks[name] = {'ok': False, 'error': str(exc)}
+        else:
+            checks[name] = {'ok': True, 'latency_ms': round(latency, 2)}
+
+    database = checks['database']
+    if database['ok'] and \
+            database['latency_ms'] > settings.HEALTHZ_MAX_DB_LATENCY_MS:
+        healthy = False
+        database['error'] = 'Slower than ' \
+            f'{settings.HEALTHZ_MAX_DB_LATENCY_MS} ms'
+    return JsonResponse({'status': 'ok' if healthy else 'unavailable',
+                         **checks}, status=200 if healthy else 503)
@@ -0,0 +1,82 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+
+LIST_TIMEOUT = 60 * 60
+
+
+def _version_key(scope, user_id):
+    return f'recipe:{scope}:version:{user_id}'
+
+
+def _modified_key(scope, user_id):
+    return f'recipe:{scope}:modified:{user_id}'
+
+
+def _new_version():
+    """Return a version that can't repeat one issued before eviction"""
+    return int(time.time() * 1000)
+
+
+def get_version(scope, user_id):
+    """Return the current version of a user's cached data in scope"""
+    key = _version_key(scope, user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_modified(scope, user_id):
+    """Return the timestamp of the user's last change in scope"""
+    key = _modified_key(scope, user_id)
+    modified = cache.get(key)
+    if modified is None:
+        # Unknown after eviction, so assume it has just changed
+        cache.add(key, int(time.time()), None)
+        modified = cache.get(key)
+    return modified
+
+
+def bump_version(scope, user_id):
+    """Invalidate everything cached for the user in scope"""
+    key = _version_key(scope, user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+    cache.set(_modified_key(scope, user_id), int(time.time()), None)
+
+
+def bump_versions(user_ids, *scopes):
+    """Invalidate the scopes of every user, e.g. after a bulk write"""
+    for user_id in user_ids:
+        for scope in scopes:
+            bump_version(scope, user_id)
+
+
+def bump_on_commit(user_ids, *scopes):
+    """Invalidate the scopes of every user once the transaction commits
+
+    Bumping before the commit would let a concurrent request cache the
+    rows it still sees under the new version, until LIST_TIMEOUT.
+    Outside a transaction the versions are bumped at once.
+    """
+    transaction.on_commit(lambda: bump_versions(user_ids, *scopes))
+
+
+def list_key(scope, user_id, *params):
+    """Return the cache key of a user's list, tied to the current version"""
+    version = get_version(scope, user_id)
+    suffix = ':'.join(str(param) for param in params)
+    return f'recipe:{scope}:list:{user_id}:{version}:{suffix}'
+
+
+def get_list(key):
+    return cache.get(key)
+
+
+def set_list(key, data):
+    cache.set(key, data, LIST_TIMEOUT)
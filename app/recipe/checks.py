@@ -0,0 +1,22 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Warning, register
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when the per-user versions live in a per-process cache
+
+    Each worker process would keep its own versions, serving lists
+    another worker has invalidated and ETags that differ per worker.
+    """
+    if not isinstance(caches['default'], LocMemCache):
+        return []
+    return [Warning(
+        'The default cache is a local memory cache, each worker process '
+        'has its own cached lists and versions.',
+        hint='Set CACHE_BACKEND and CACHE_LOCATION to a cache the workers '
+             'share, e.g. memcached as in docker-compose.yml, or run a '
+             'single process.',
+        id='recipe.W001',
+    )]
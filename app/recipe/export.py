@@ -0,0 +1,63 @@
+import csv
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import CharField
+from recipe.rows import related_values
+
+
+EXPORT_FIELDS = ('id', 'title', 'time_minutes', 'price', 'link', 'image')
+RELATIONS = (('tags', 'tag'), ('ingredients', 'ingredient'))
+
+
+class Echo:
+    """File-like object returning what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_recipes(queryset, request, chunk_size=1000):
+    """Yield recipes as dicts with their tag and ingredient names
+
+    Recipes and their names are read in one query through a server-side
+    cursor, so memory use doesn't grow with the number of recipes.
+    """
+    names = {f'{field}_names': related_values(
+        queryset.model, field, f'{column}__name', CharField()
+    ) for field, column in RELATIONS}
+    rows = queryset.annotate(**names) \
+        .values(*EXPORT_FIELDS, *names).iterator(chunk_size=chunk_size)
+    for row in rows:
+        if row['image']:
+            row['image'] = request.build_absolute_uri(
+                default_storage.url(row['image'])
+            )
+        else:
+            row['image'] = None
+        for field, column in RELATIONS:
+            row[field] = row.pop(f'{field}_names')
+        yield row
+
+
+def ndjson_lines(recipes):
+    """Yield one JSON document per line"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for recipe in recipes:
+        yield encoder.encode(recipe) + '\n'
+
+
+def csv_lines(recipes):
+    """Yield a header then one CSV row per recipe, names joined by |"""
+    columns = EXPORT_FIELDS + tuple(field for field, column in RELATIONS)
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for recipe in recipes:
+        for field, column in RELATIONS:
+            recipe[field] = '|'.join(recipe[field])
+        yield writer.writerow([recipe[column] for column in columns])
+
+
+FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
@@ -0,0 +1,67 @@
+from decimal import Decimal
+from django.db.models import Count, Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+MATCH_MODES = (MATCH_ANY, MATCH_ALL)
+
+
+def parse_ids(param, value):
+    """Convert a comma separated query param to a sorted list of int ids"""
+    try:
+        return sorted({int(str_id) for str_id in value.split(',')
+                       if str_id.strip()})
+    except ValueError:
+        raise ValidationError(
+            {param: ['Enter a comma separated list of ids.']}
+        )
+
+
+def parse_number(param, value, convert):
+    """Convert a numeric query param, e.g. with int or Decimal"""
+    try:
+        number = convert(value)
+    except (ValueError, ArithmeticError):
+        number = None
+    if number is None or not Decimal(number).is_finite():
+        raise ValidationError({param: ['Enter a number.']})
+    return number
+
+
+def parse_match(value):
+    """Return the match mode of a query param, 'any' by default"""
+    match = value or MATCH_ANY
+    if match not in MATCH_MODES:
+        raise ValidationError(
+            {'match': [f'Choose one of {", ".join(MATCH_MODES)}.']}
+        )
+    return match
+
+
+def filter_related(queryset, field, ids, match=MATCH_ANY):
+    """Filter objs linked to any or all of the ids through a m2m field
+
+    Both modes query the through table in a subquery rather than joining
+    it, so every obj is returned once, and the plan has the same shape
+    however many ids are given: an index scan of the through table for
+    the ids, then a semi-join on the obj's primary key.
+    """
+    m2m = queryset.model._meta.get_field(field)
+    own_column, related_column = m2m.m2m_column_name(), m2m.m2m_reverse_name()
+    links = m2m.remote_field.through.objects.filter(
+        **{f'{related_column}__in': ids}
+    )
+
+    if match == MATCH_ALL:
+        # Links are unique, so an obj has all the ids when it has as many
+        # links among them as there are ids
+        return queryset.filter(pk__in=links.values(own_column).annotate(
+            matched=Count(related_column)
+        ).filter(matched=len(ids)).values(own_column))
+
+    annotation = f'{field}_matched'
+    return queryset.annotate(**{
+        annotation: Exists(links.filter(**{own_column: OuterRef('pk')}))
+    }).filter(**{annotation: True})
@@ -0,0 +1,166 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, features
+from core import models
+from core.storage import lock_name
+from recipe import cache
+
+
+logger = logging.getLogger(__name__)
+
+# name -> (bounding box, format, file extension, save options)
+VARIANTS = {
+    'thumbnail': ((200, 200), 'JPEG', 'jpg', {'quality': 80}),
+    'medium': ((800, 800), 'JPEG', 'jpg', {'quality': 85}),
+    'webp': ((800, 800), 'WEBP', 'webp', {'quality': 80}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(image_name, variant, extension):
+    """Return the storage name of a variant next to the original image"""
+    root = os.path.splitext(image_name)[0]
+    return f'{root}-{variant}.{extension}'
+
+
+def image_storage():
+    """Return the content addressed storage of recipe images"""
+    return models.Recipe._meta.get_field('image').storage
+
+
+def open_image(image_name):
+    """Return the decoded recipe image"""
+    with image_storage().open(image_name) as f:
+        image = Image.open(f)
+        image.load()
+    return image
+
+
+def render_variant(image, size, image_format, options):
+    """Return the bytes of an image resized to fit in size"""
+    copy = image.copy()
+    copy.thumbnail(size, Image.LANCZOS)
+    if copy.mode not in ('RGB', 'L'):
+        copy = copy.convert('RGB')
+    buffer = io.BytesIO()
+    copy.save(buffer, format=image_format, optimize=True, **options)
+    return buffer.getvalue()
+
+
+def variant_supported(image_format):
+    """Return whether the installed Pillow can encode a variant format
+
+    Pillow built without libwebp can't write WebP variants.
+    """
+    return image_format != 'WEBP' or features.check('webp')
+
+
+def generate_variants(recipe_id, user_id, image_name, force=False):
+    """Write the variants of a recipe image and record their names
+
+    Variants already stored are kept unless force regenerates them. A
+    variant failing to render is logged and left out, the others are
+    still recorded. The names are only recorded if the recipe still has
+    the image, a newer upload schedules its own variants.
+    """
+    storage = image_storage()
+    image = None
+    names = {}
+    for variant, (size, image_format, extension, options) \
+            in VARIANTS.items():
+        if not variant_supported(image_format):
+            continue
+        name = variant_name(image_name, variant, extension)
+        # Image names are content hashes, so variants of an image
+        # another recipe shares are already there
+        if force or not storage.exists(name):
+            if image is None:
+                image = open_image(image_name)
+            try:
+                content = render_variant(image, size, image_format, options)
+            except (OSError, KeyError, ValueError):
+                logger.exception('Generating the %s variant of %s failed',
+                                 variant, image_name)
+                continue
+            storage.save_derived(name, ContentFile(content))
+        names[variant] = name
+
+    updated = models.Recipe.objects.filter(
+        id=recipe_id, image=image_name
+    ).update(image_variants=names)
+    if not updated:
+        release_image(image_name, names)
+        return
+    # The update sends no signals to invalidate the cached lists
+    cache.bump_version('recipe', user_id)
+
+
+def release_image(image_name, variant_names=None):
+    """Delete an image and its variants unless a recipe still uses it
+
+    Recipes with equal images share the files, the recipes referencing a
+    name are its reference count. They are counted holding the name's
+    lock, which an upload of the same content holds until its recipe
+    commits. Variants are deleted under their current names too, in
+    case they were written after the recipe's names were read.
+    """
+    if not image_name:
+        return
+    storage = image_storage()
+    with transaction.atomic():
+        lock_name(image_name)
+        if models.Recipe.objects.filter(image=image_name).exists():
+            return
+        storage.delete(image_name)
+        names = {variant_name(image_name, variant, extension)
+                 for variant, (size, image_format, extension, options)
+                 in VARIANTS.items()}
+        for name in names | set((variant_names or {}).values()):
+            storage.delete(name)
+
+
+def _run(recipe_id, user_id, image_name):
+    """Generate variants in a pool thread with its own connection"""
+    close_old_connections()
+    try:
+        generate_variants(recipe_id, user_id, image_name)
+    except Exception:
+        logger.exception('Generating variants of %s failed', image_name)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    """Return the worker pool, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                thread_name_prefix='image-variants'
+            )
+        return _executor
+
+
+def schedule_variants(recipe):
+    """Generate the variants of a recipe image once saved
+
+    Pillow releases the GIL while resizing and encoding, so a thread
+    pool keeps the work off the request without a task queue. With no
+    workers configured the variants are generated in the request.
+    """
+    if not recipe.image:
+        return
+    args = (recipe.id, recipe.user_id, recipe.image.name)
+    if settings.IMAGE_VARIANT_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(_run, *args))
+    else:
+        transaction.on_commit(lambda: generate_variants(*args))
@@ -0,0 +1,110 @@
+import hashlib
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.exceptions import ValidationError
+from recipe import cache
+
+
+class ConditionalRequestMixin:
+    """Answer conditional GETs from the user's change version
+
+    The ETag and Last-Modified validators come from the per-user version
+    kept in the cache, so an unchanged resource gets a 304 before the
+    queryset or serializer runs. The ETag also covers the path and query
+    string, so each page, filter and object has its own. Versions are
+    bumped once writes commit, and the cache has to be shared by the
+    worker processes for them to agree, see recipe.checks.
+    """
+    version_scope = None
+
+    def get_version_scope(self):
+        return self.version_scope or self.queryset.model._meta.model_name
+
+    def get_validators(self, request):
+        """Return the ETag and Last-Modified timestamp of the resource"""
+        scope = self.get_version_scope()
+        version = cache.get_version(scope, request.user.id)
+        tag = hashlib.md5(
+            f'{scope}:{request.user.id}:{version}:'
+            f'{request.accepted_media_type}:{request.get_full_path()}'
+            .encode()
+        ).hexdigest()
+        return f'"{tag}"', cache.get_modified(scope, request.user.id)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        """Return a 304 if the client's copy is current, else the handler's"""
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(request, etag=etag,
+                                            last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class SparseFieldsMixin:
+    """Render and query only the fields requested with ?fields=id,title
+
+    The serializer drops the other fields, and get_sparse_columns() and
+    get_sparse_fields() tell get_queryset() which columns to load and
+    which relations to prefetch.
+    """
+    fields_query_param = 'fields'
+    sparse_actions = ('list', 'retrieve')
+
+    def get_sparse_fields(self):
+        """Return the requested field names, None if all are wanted"""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self._parse_sparse_fields()
+        return self._sparse_fields
+
+    def _parse_sparse_fields(self):
+        value = self.request.query_params.get(self.fields_query_param)
+        if not value or self.action not in self.sparse_actions:
+            return None
+        requested = {name.strip() for name in value.split(',')
+                     if name.strip()}
+        available = self.get_serializer_class()().fields
+        unknown = requested - set(available)
+        if unknown:
+            raise ValidationError({self.fields_query_param: [
+                f'Unknown fields: {", ".join(sorted(unknown))}. '
+                f'Choose from {", ".join(available)}.'
+            ]})
+        return [name for name in available if name in requested]
+
+    def get_sparse_columns(self, *required):
+        """Return the model columns the requested fields read, or None
+
+        The primary key and the required columns, e.g. those the results
+        are paginated by, are always included.
+        """
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return None
+        serializer_fields = self.get_serializer_class()().fields
+        names = [self.queryset.model._meta.pk.name, *required,
+                 *(serializer_fields[name].source for name in fields)]
+        return [name for name in dict.fromkeys(names)
+                if self._is_column(name)]
+
+    def _is_column(self, name):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # e.g. an annotation
+            return False
+        return field.concrete and not field.many_to_many
+
+    def get_serializer(self, *args, **kwargs):
+        """Return the serializer without the fields not requested"""
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            target = getattr(serializer, 'child', serializer)
+            for name in set(target.fields) - set(fields):
+                target.fields.pop(name)
+        return serializer
@@ -0,0 +1,195 @@
+import json
+from collections import OrderedDict
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+
+def estimate_count(queryset, exact_below=1000):
+    """Return the number of rows in a queryset without a full COUNT(*)
+
+    On PostgreSQL the planner's row estimate is used, falling back to an
+    exact count when the estimate is small enough for counting to be cheap.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+
+    if estimate < exact_below:
+        return queryset.count()
+    return estimate
+
+
+class RecipeCursorPagination(pagination.CursorPagination):
+    """Keyset pagination over recipes, newest first by default
+
+    Views may order differently through get_ordering(): by one field
+    followed by a unique one, e.g. ('price', 'id'). The cursor holds the
+    values of both fields at the edge of the page, so the next page is
+    read from an index on the fields starting right after it, without
+    sorting or skipping rows. NULLs sort after every value, as they do
+    in PostgreSQL indexes.
+    """
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return the page after or before the cursor position"""
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = estimate_count(queryset)
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        cursor = self.decode_cursor(request)
+        key = self._decode_position(cursor)
+        reverse = bool(cursor and cursor.reverse)
+        ordering = [_flip(field) for field in self.ordering] \
+            if reverse else list(self.ordering)
+
+        rows = self._rows_after(queryset, ordering, key, self.page_size + 1)
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, key is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        """Return the view's ordering, e.g. by search rank"""
+        if hasattr(view, 'get_ordering'):
+            ordering = tuple(view.get_ordering())
+        else:
+            ordering = super().get_ordering(request, queryset, view)
+        assert len(ordering) <= 2, (
+            'Recipes are paginated by at most one field and a unique one.'
+        )
+        return ordering
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(pagination.Cursor(
+            offset=0, reverse=False, position=self._position(self.page[-1])
+        ))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(pagination.Cursor(
+            offset=0, reverse=True, position=self._position(self.page[0])
+        ))
+
+    def get_paginated_response(self, data):
+        """Return the page with links and the optional estimated count"""
+        content = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            content['count'] = self.count
+        content['results'] = data
+        return Response(content)
+
+    def _position(self, obj):
+        """Encode the ordering values of an obj or row as a position"""
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(obj, dict):
+            values = [obj[name] for name in names]
+        else:
+            values = [getattr(obj, name) for name in names]
+        return json.dumps(values, cls=DjangoJSONEncoder)
+
+    def _decode_position(self, cursor):
+        """Return the ordering values of a cursor, None without one"""
+        if cursor is None:
+            return None
+        try:
+            key = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(key, list) or len(key) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return key
+
+    def _rows_after(self, queryset, ordering, key, limit):
+        """Return up to limit rows following key in the ordering
+
+        Rows with and without a value in a nullable field are read in two
+        index ranges, the second only when the first runs out.
+        """
+        *fields, unique = ordering
+        queryset = queryset.order_by(*ordering)
+        if not fields:
+            if key is not None:
+                queryset = queryset.filter(_after(unique, key[0]))
+            return list(queryset[:limit])
+
+        field = fields[0]
+        name = field.lstrip('-')
+        try:
+            nullable = queryset.model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            # Annotations, like the search rank, are never NULL
+            nullable = False
+        # Ascending orders end with NULLs, descending ones start with them
+        ranges = [False, True] if field == name else [True, False]
+        if not nullable:
+            ranges = [False]
+
+        rows = []
+        if key is not None:
+            value, last = key
+            if (value is None) not in ranges:
+                raise NotFound(self.invalid_cursor_message)
+            ranges = ranges[ranges.index(value is None):]
+            if value is None:
+                range_rows = queryset.filter(_after(unique, last),
+                                             **{f'{name}__isnull': True})
+            else:
+                range_rows = queryset.filter(
+                    _after(field, value, inclusive=True),
+                    _after(field, value) | _after(unique, last)
+                )
+            rows += range_rows[:limit]
+            ranges = ranges[1:]
+        for is_null in ranges:
+            if len(rows) >= limit:
+                break
+            range_rows = queryset.filter(**{f'{name}__isnull': is_null}) \
+                if nullable else queryset
+            rows += range_rows[:limit - len(rows)]
+        return rows
+
+
+def _flip(field):
+    """Return the opposite order of an ordering field"""
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def _after(field, value, inclusive=False):
+    """Return a filter for values following value in a field's order"""
+    lookup = 'lt' if field.startswith('-') else 'gt'
+    if inclusive:
+        lookup += 'e'
+    return Q(**{f'{field.lstrip("-")}__{lookup}': value})
@@ -1,26 +1,71 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from core import models
+from core.timing import timed
+from recipe import cache
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TimedDataMixin:
+    """Record the time spent building .data as the serialize timing"""
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    """List serializer recording its serialize timing"""
+
+
+class TagSerializer(TimedDataMixin, serializers.ModelSerializer):
     """Serializer for tag obj"""
 
     class Meta:
         model = models.Tag
         fields = ('id', 'name')
         read_only_fields = ('id',)
+        list_serializer_class = TimedListSerializer
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedDataMixin, serializers.ModelSerializer):
     """Serializer for ingredient obj"""
 
     class Meta:
         model = models.Ingredient
         fields = ('id', 'name')
         read_only_field = ('id',)
+        list_serializer_class = TimedListSerializer
+
 
+class AttrBatchSerializer(serializers.Serializer):
+    """Serializer for a batch of tag or ingredient names"""
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        min_length=1,
+        max_length=1000)
 
-class RecipeSerializer(serializers.ModelSerializer):
+
+class ImageVariantsField(serializers.Field):
+    """Read only URLs of the resized copies of a recipe image"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in value.items():
+            url = default_storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) \
+                if request is not None else url
+        return urls
+
+
+class RecipeSerializer(TimedDataMixin, serializers.ModelSerializer):
     """Serializer for recipes obj"""
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -28,11 +73,12 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(
         many=True,
         queryset=models.Tag.objects.all())
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = models.Recipe
         fields = ('id', 'title', 'time_minutes', 'price', 'ingredients',
-                  'tags', 'link', 'image')
+                  'tags', 'link', 'image', 'image_variants')
         read_only_field = ('id',)
 
 
@@ -46,10 +92,87 @@ class RecipeDetailSerializer(RecipeSerializer):
         read_only=True)
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(TimedDataMixin, serializers.ModelSerializer):
     """Serializer for uploading images to recipes"""
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = models.Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_variants')
         read_only_field = ('id',)
+
+
+class RecipeBulkListSerializer(serializers.ListSerializer):
+    """Serializer creating a batch of recipes with batched inserts"""
+    max_items = 1000
+    batch_size = 500
+    relations = (
+        ('tags', models.Tag, 'tag_id'),
+        ('ingredients', models.Ingredient, 'ingredient_id'),
+    )
+
+    def to_internal_value(self, data):
+        """Validate every recipe, then all related ids in one go"""
+        if isinstance(data, list) and len(data) > self.max_items:
+            message = f'Ensure there are no more than {self.max_items} items.'
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [message]
+            })
+        items = super().to_internal_value(data)
+
+        user = self.context['request'].user
+        errors = [{} for item in items]
+        message = serializers.PrimaryKeyRelatedField \
+            .default_error_messages['does_not_exist']
+        for field, model, column in self.relations:
+            ids = {pk for item in items for pk in item.get(field, ())}
+            known = set(model.objects.filter(user=user, id__in=ids)
+                        .values_list('id', flat=True)) if ids else set()
+            for item, item_errors in zip(items, errors):
+                unknown = sorted(set(item.get(field, ())) - known)
+                if unknown:
+                    item_errors[field] = [str(message).format(pk_value=pk)
+                                          for pk in unknown]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return items
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """Insert the recipes, then their tag and ingredient links"""
+        related = [field for field, model, column in self.relations]
+        recipes = models.Recipe.objects.bulk_create([
+            models.Recipe(**{key: value for key, value in item.items()
+                             if key not in related})
+            for item in validated_data
+        ], batch_size=self.batch_size)
+
+        for field, model, column in self.relations:
+            through = getattr(models.Recipe, field).through
+            through.objects.bulk_create([
+                through(recipe_id=recipe.id, **{column: pk})
+                for recipe, item in zip(recipes, validated_data)
+                for pk in dict.fromkeys(item.get(field, ()))
+            ], batch_size=self.batch_size)
+
+        # Bulk inserts send no signals to invalidate cached data
+        user_ids = {recipe.user_id for recipe in recipes}
+        cache.bump_on_commit(user_ids, 'recipe', 'tag', 'ingredient')
+        return recipes
+
+
+class RecipeBulkSerializer(serializers.ModelSerializer):
+    """Serializer for one recipe of a bulk create"""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False)
+
+    class Meta:
+        model = models.Recipe
+        fields = ('title', 'time_minutes', 'price', 'ingredients', 'tags',
+                  'link')
+        list_serializer_class = RecipeBulkListSerializer
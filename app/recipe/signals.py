@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from core import models
+from recipe import cache, images
+
+
+@receiver(post_save, sender=models.Tag)
+@receiver(post_delete, sender=models.Tag)
+@receiver(post_save, sender=models.Ingredient)
+@receiver(post_delete, sender=models.Ingredient)
+def invalidate_attr(sender, instance, **kwargs):
+    """Invalidate the cached list a tag or ingredient belongs to"""
+    # Recipes render the ids and names of their tags and ingredients
+    cache.bump_on_commit([instance.user_id], sender._meta.model_name,
+                         'recipe')
+
+
+@receiver(m2m_changed, sender=models.Recipe.tags.through)
+@receiver(m2m_changed, sender=models.Recipe.ingredients.through)
+def invalidate_recipe_links(sender, instance, action, reverse, model,
+                            **kwargs):
+    """Invalidate recipes and assigned_only lists when links change"""
+    if not action.startswith('post_'):
+        return
+    attr_model = type(instance) if reverse else model
+    cache.bump_on_commit([instance.user_id], attr_model._meta.model_name,
+                         'recipe')
+
+
+@receiver(post_save, sender=models.Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    """Invalidate the owner's recipes"""
+    cache.bump_on_commit([instance.user_id], 'recipe')
+
+
+@receiver(post_delete, sender=models.Recipe)
+def invalidate_deleted_recipe(sender, instance, **kwargs):
+    """Invalidate recipes and the assigned_only lists they were linked from"""
+    cache.bump_on_commit([instance.user_id], 'tag', 'ingredient', 'recipe')
+
+
+@receiver(post_delete, sender=models.Recipe)
+def release_deleted_recipe_image(sender, instance, **kwargs):
+    """Delete the recipe's image files unless other recipes share them"""
+    if instance.image:
+        name, variants = instance.image.name, instance.image_variants
+        transaction.on_commit(lambda: images.release_image(name, variants))
@@ -0,0 +1,23 @@
+from django.test import SimpleTestCase, override_settings
+
+from recipe.checks import check_shared_cache
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    """Test the check of the cache holding the versions"""
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }})
+    def test_local_cache_warns(self):
+        """Test a local memory cache is reported"""
+        errors = check_shared_cache(None)
+
+        self.assertEqual([error.id for error in errors], ['recipe.W001'])
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }})
+    def test_other_cache_passes(self):
+        """Test any other backend is assumed to be shared"""
+        self.assertEqual(check_shared_cache(None), [])
@@ -4,6 +4,7 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 from core import models
+from core.tests.utils import capture_on_commit_callbacks
 from recipe import serializers
 
 
@@ -109,7 +110,7 @@ class PrivateIngredientsAPITests(TestCase):
             name='Breakfast')
         models.Ingredient.objects.create(
             user=self.user,
-            name='Breakfast')
+            name='Dinner')
         recipe1 = models.Recipe.objects.create(
             title='Pancakes',
             time_minutes=5,
@@ -126,3 +127,26 @@ class PrivateIngredientsAPITests(TestCase):
 
         res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
         self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_ingredients_assigned_cache_invalidated(self):
+        """Test assigned ingredients are refreshed when recipes change"""
+        ingredient = models.Ingredient.objects.create(user=self.user,
+                                                      name='Eggs')
+        recipe = models.Recipe.objects.create(
+            title='Omelette',
+            time_minutes=5,
+            price=3.00,
+            user=self.user)
+
+        res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
+        self.assertEqual(len(res.data), 0)
+
+        with capture_on_commit_callbacks(execute=True):
+            ingredient.recipe_set.add(recipe)
+        res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
+        self.assertEqual(len(res.data), 1)
+
+        with capture_on_commit_callbacks(execute=True):
+            recipe.ingredients.clear()
+        res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
+        self.assertEqual(len(res.data), 0)
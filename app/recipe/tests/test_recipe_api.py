@@ -1,16 +1,32 @@
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
+import csv
+import hashlib
+import io
+import json
+import msgpack
 import tempfile
+import threading
 import os
+from unittest.mock import patch
 from PIL import Image
 from core import models
-from recipe import serializers
+from core.tests.utils import capture_on_commit_callbacks
+from recipe import images, serializers
+from recipe.views import RecipeViewset
 
 
 RECIPE_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk-create')
+EXPORT_URL = reverse('recipe:recipe-export')
 
 
 def image_upload_url(recipe_id):
@@ -79,7 +95,7 @@ class PrivateRecipeAPITests(TestCase):
         serializer = serializers.RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         """Test retrieving recipes for user"""
@@ -95,9 +111,9 @@ class PrivateRecipeAPITests(TestCase):
         serializer = serializers.RecipeSerializer(recipes, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
-        self.assertEqual(res.data[0]['title'], recipe.title)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
+        self.assertEqual(res.data['results'][0]['title'], recipe.title)
 
     def test_view_recipe_detail(self):
         """Test viewing recipe details"""
@@ -113,6 +129,169 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_list_recipes_query_count(self):
+        """Test listing recipes runs a constant number of queries"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = res.data['results']
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0]['tags'], [tag.id])
+        self.assertEqual(results[0]['ingredients'], [ingredient.id])
+
+    def test_recipes_paginated_by_cursor(self):
+        """Test recipes are returned in pages following the next link"""
+        recipes = [sample_recipe(user=self.user, title=f'Recipe {i}')
+                   for i in range(5)]
+
+        res = self.client.get(RECIPE_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', res.data)
+        self.assertIsNone(res.data['previous'])
+        ids = [recipe['id'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            ids += [recipe['id'] for recipe in res.data['results']]
+
+        self.assertEqual(ids, [recipe.id for recipe in reversed(recipes)])
+
+    def test_recipes_paginated_with_count(self):
+        """Test the total count is included when requested"""
+        for i in range(3):
+            sample_recipe(user=self.user, title=f'Recipe {i}')
+
+        res = self.client.get(RECIPE_URL, {'page_size': 2, 'count': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 3)
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_list_recipes_not_modified(self):
+        """Test unchanged recipes are answered with a 304"""
+        sample_recipe(user=self.user)
+        res = self.client.get(RECIPE_URL)
+        etag = res['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.get(RECIPE_URL,
+                              HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with capture_on_commit_callbacks(execute=True):
+            sample_recipe(user=self.user, title='Another recipe')
+        res = self.client.get(RECIPE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(len(res.data['results']), 2)
+
+    def test_view_recipe_detail_not_modified(self):
+        """Test a recipe detail is revalidated when its tags change"""
+        recipe = sample_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with capture_on_commit_callbacks(execute=True):
+            recipe.tags.add(sample_tag(user=self.user))
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 1)
+
+    def test_etag_depends_on_url(self):
+        """Test another page or recipe is not answered with a 304"""
+        recipe = sample_recipe(user=self.user)
+        other = sample_recipe(user=self.user, title='Other recipe')
+        etag = self.client.get(detail_url(recipe.id))['ETag']
+
+        res = self.client.get(detail_url(other.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['id'], other.id)
+
+        etag = self.client.get(RECIPE_URL)['ETag']
+        res = self.client.get(RECIPE_URL, {'ordering': 'price'},
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_view_missing_recipe_not_modified(self):
+        """Test a missing or foreign recipe is a 404, not a 304"""
+        user2 = get_user_model().objects.create_user('other@gmail.com',
+                                                     'password123')
+        foreign = sample_recipe(user=user2)
+
+        # * matches any current ETag
+        for url in (detail_url(foreign.id + 1000), detail_url(foreign.id)):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_view_recipe_detail_query_count(self):
+        """Test viewing recipe details runs a constant number of queries"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user),
+                        sample_tag(user=self.user, name='Vegan'))
+        recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 2)
+        self.assertEqual(len(res.data['ingredients']), 1)
+
+    def test_list_recipes_sparse_fields(self):
+        """Test fields= trims the output and the columns queried"""
+        recipe = sample_recipe(user=self.user, title='Soup')
+        recipe.tags.add(sample_tag(user=self.user))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPE_URL, {'fields': 'title,id',
+                                               'ordering': 'price'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'],
+                         [{'id': recipe.id, 'title': 'Soup'}])
+        # The priced recipes, then the unpriced ones, no deferred loads
+        self.assertEqual(len(queries), 2)
+        for query in queries:
+            self.assertNotIn('"core_recipe"."link"', query['sql'])
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPE_URL, {'fields': 'id,tags'})
+        self.assertEqual(res.data['results'][0]['tags'],
+                         [recipe.tags.get().id])
+
+    def test_view_recipe_detail_sparse_fields(self):
+        """Test fields= trims the recipe detail and its prefetches"""
+        recipe = sample_recipe(user=self.user)
+        recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        with self.assertNumQueries(2):
+            res = self.client.get(detail_url(recipe.id),
+                                  {'fields': 'ingredients'})
+
+        self.assertEqual(list(res.data), ['ingredients'])
+        self.assertEqual(res.data['ingredients'][0]['name'], 'Cinnamon')
+
+    def test_list_recipes_unknown_fields(self):
+        """Test asking for fields recipes don't have is rejected"""
+        res = self.client.get(RECIPE_URL, {'fields': 'id,owner'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.data)
+
     def test_create_basic_recipe(self):
         """Test creating recipe"""
         payload = {
@@ -128,6 +307,30 @@ class PrivateRecipeAPITests(TestCase):
         for key in payload.keys():
             self.assertEqual(payload[key], getattr(recipe, key))
 
+    def test_create_and_list_recipes_as_msgpack(self):
+        """Test MessagePack bodies and responses are negotiated"""
+        tag = sample_tag(user=self.user)
+        body = msgpack.packb({'title': 'Soup', 'time_minutes': 10,
+                              'price': '4.50', 'tags': [tag.id],
+                              'ingredients': []})
+
+        res = self.client.post(RECIPE_URL, body,
+                               content_type='application/msgpack',
+                               HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res['Content-Type'], 'application/msgpack')
+        created = msgpack.unpackb(res.content, raw=False)
+        self.assertEqual(created['price'], '4.50')
+        self.assertEqual(created['tags'], [tag.id])
+
+        res = self.client.get(RECIPE_URL, HTTP_ACCEPT='application/msgpack')
+        listed = msgpack.unpackb(res.content, raw=False)
+        self.assertEqual(listed['results'], [created])
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(res.content)['results'], [created])
+
     def test_creating_recipe_with_tags(self):
         """Test creating the recipe with tags"""
         tag1 = sample_tag(user=self.user, name='Vegan')
@@ -240,6 +443,138 @@ class REcipeImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def _upload(self, size=(1200, 900)):
+        """Upload a JPEG of the given size to the recipe"""
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            Image.new('RGB', size).save(ntf, format='JPEG')
+            ntf.seek(0)
+            return self.client.patch(image_upload_url(self.recipe.id),
+                                     {'image': ntf}, format='multipart')
+
+    def test_upload_image_schedules_variants(self):
+        """Test uploading an image queues its variants, keeping tags"""
+        tag = sample_tag(user=self.user)
+        self.recipe.tags.add(tag)
+
+        with patch('recipe.images.schedule_variants') as schedule:
+            res = self._upload()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['image_variants'])
+        schedule.assert_called_once_with(self.recipe)
+        self.assertEqual(list(self.recipe.tags.all()), [tag])
+
+    def test_generate_image_variants(self):
+        """Test variants are resized and listed with the recipe"""
+        with patch('recipe.images.schedule_variants'):
+            self._upload()
+        self.recipe.refresh_from_db()
+
+        images.generate_variants(self.recipe.id, self.user.id,
+                                 self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        variants = self.recipe.image_variants
+        self.addCleanup(lambda: [default_storage.delete(name)
+                                 for name in variants.values()])
+        self.assertEqual(set(variants), set(images.VARIANTS))
+        with default_storage.open(variants['thumbnail']) as f:
+            self.assertEqual(Image.open(f).size, (200, 150))
+        with default_storage.open(variants['webp']) as f:
+            self.assertEqual(Image.open(f).format, 'WEBP')
+
+        res = self.client.get(RECIPE_URL)
+        urls = res.data['results'][0]['image_variants']
+        self.assertTrue(urls['medium'].startswith('http://testserver/'))
+        self.assertTrue(urls['medium'].endswith('-medium.jpg'))
+
+    def test_generate_image_variants_without_webp(self):
+        """Test WebP variants are skipped when Pillow can't encode them"""
+        with patch('recipe.images.schedule_variants'):
+            self._upload()
+        self.recipe.refresh_from_db()
+
+        with patch('recipe.images.features.check', return_value=False):
+            images.generate_variants(self.recipe.id, self.user.id,
+                                     self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        variants = self.recipe.image_variants
+        self.addCleanup(lambda: [default_storage.delete(name)
+                                 for name in variants.values()])
+        self.assertEqual(set(variants), {'thumbnail', 'medium'})
+
+    def test_generate_image_variants_failure_isolated(self):
+        """Test a variant failing to render doesn't lose the others"""
+        with patch('recipe.images.schedule_variants'):
+            self._upload()
+        self.recipe.refresh_from_db()
+        render = images.render_variant
+
+        def render_variant(image, size, image_format, options):
+            if image_format == 'WEBP':
+                raise OSError('encoder error')
+            return render(image, size, image_format, options)
+
+        with patch('recipe.images.render_variant', render_variant), \
+                self.assertLogs('recipe.images', 'ERROR'):
+            images.generate_variants(self.recipe.id, self.user.id,
+                                     self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        variants = self.recipe.image_variants
+        self.addCleanup(lambda: [default_storage.delete(name)
+                                 for name in variants.values()])
+        self.assertEqual(set(variants), {'thumbnail', 'medium'})
+        self.assertFalse(default_storage.exists(images.variant_name(
+            self.recipe.image.name, 'webp', 'webp'
+        )))
+
+    def test_generate_image_variants_of_replaced_image(self):
+        """Test variants of an image replaced meanwhile are discarded"""
+        with patch('recipe.images.schedule_variants'):
+            self._upload()
+        self.recipe.refresh_from_db()
+        old_name = self.recipe.image.name
+        with patch('recipe.images.schedule_variants'):
+            self._upload(size=(600, 400))
+        self.addCleanup(default_storage.delete, old_name)
+
+        images.generate_variants(self.recipe.id, self.user.id, old_name)
+
+        self.recipe.refresh_from_db()
+        self.assertIsNone(self.recipe.image_variants)
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertFalse(default_storage.exists(
+            images.variant_name(old_name, 'thumbnail', 'jpg')
+        ))
+
+    def test_equal_images_share_one_file(self):
+        """Test recipes with the same image share its file until the
+        last of them is deleted"""
+        other = sample_recipe(user=self.user, title='Other')
+        with patch('recipe.images.schedule_variants'):
+            self._upload()
+            self.recipe.refresh_from_db()
+            content = self.recipe.image.read()
+            self.client.patch(image_upload_url(other.id), {
+                'image': SimpleUploadedFile('copy.jpg', content),
+            }, format='multipart')
+        other.refresh_from_db()
+        name = self.recipe.image.name
+
+        self.assertEqual(other.image.name, name)
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(name, f'uploads/recipe/{digest[:2]}/{digest}.jpg')
+
+        other.delete()
+        images.release_image(name)
+        self.assertTrue(default_storage.exists(name))
+
+        self.recipe.delete()
+        images.release_image(name)
+        self.assertFalse(default_storage.exists(name))
+
     def test_upload_image_bad_request(self):
         """Test uploading an invalid image"""
         url = image_upload_url(self.recipe.id)
@@ -270,9 +605,9 @@ class REcipeImageUploadTests(TestCase):
         serializer2 = serializers.RecipeSerializer(recipe2)
         serializer3 = serializers.RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_recipe_by_ingredients(self):
         """Test returning recipe with specific ingredients"""
@@ -298,6 +633,370 @@ class REcipeImageUploadTests(TestCase):
         serializer2 = serializers.RecipeSerializer(recipe2)
         serializer3 = serializers.RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+    def test_filter_recipe_by_tags_returns_each_recipe_once(self):
+        """Test a recipe having several of the tags is listed once"""
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Vegetarian')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPE_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual([r['id'] for r in res.data['results']], [recipe.id])
+
+    def test_filter_recipe_matching_all_tags_and_ingredients(self):
+        """Test returning recipes having every given tag and ingredient"""
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dinner')
+        ingredient = sample_ingredient(user=self.user, name='Tofu')
+        recipe1 = sample_recipe(user=self.user, title='Tofu curry')
+        recipe1.tags.add(tag1, tag2)
+        recipe1.ingredients.add(ingredient)
+        recipe2 = sample_recipe(user=self.user, title='Salad')
+        recipe2.tags.add(tag1)
+        recipe2.ingredients.add(ingredient)
+        recipe3 = sample_recipe(user=self.user, title='Stew')
+        recipe3.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPE_URL, {
+            'tags': f'{tag1.id},{tag2.id},{tag2.id}',
+            'ingredients': str(ingredient.id),
+            'match': 'all',
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data['results']],
+                         [recipe1.id])
+
+    def test_filter_recipe_invalid_params(self):
+        """Test invalid ids or match modes are rejected"""
+        res = self.client.get(RECIPE_URL, {'tags': '1,two'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data)
+
+        res = self.client.get(RECIPE_URL, {'tags': '1', 'match': 'most'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('match', res.data)
+
+
+class ImageReleaseRaceTests(TransactionTestCase):
+
+    def test_release_waits_for_upload_of_same_content(self):
+        """Test a file isn't deleted while an upload of the same content
+        is committing a recipe referencing it"""
+        user = get_user_model().objects.create_user('test@gmail.com',
+                                                    'testpass')
+        recipe = sample_recipe(user=user)
+        storage = images.image_storage()
+        name = storage.save('uploads/recipe/race.jpg', ContentFile(b'race'))
+        self.addCleanup(storage.delete, name)
+        released = threading.Event()
+
+        def release():
+            try:
+                images.release_image(name)
+            finally:
+                connection.close()
+                released.set()
+
+        thread = threading.Thread(target=release)
+        with transaction.atomic():
+            # A second upload of the same content gets the stored name
+            self.assertEqual(storage.save('uploads/recipe/copy.jpg',
+                                          ContentFile(b'race')), name)
+            models.Recipe.objects.filter(id=recipe.id).update(image=name)
+            thread.start()
+            self.assertFalse(released.wait(0.5))
+        thread.join()
+
+        self.assertTrue(storage.exists(name))
+
+        models.Recipe.objects.filter(id=recipe.id).update(image=None)
+        images.release_image(name)
+        self.assertFalse(storage.exists(name))
+
+
+class RecipeBulkCreateTests(TestCase):
+    """Test creating recipes in bulk"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'admin@gmail.com',
+            '1qazxsw2')
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_recipes(self):
+        """Test creating several recipes with tags and ingredients"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        payload = [
+            {'title': 'Soup', 'time_minutes': 20, 'price': '4.50',
+             'tags': [tag.id], 'ingredients': [ingredient.id]},
+            {'title': 'Salad', 'time_minutes': 5, 'price': '3.00',
+             'ingredients': [ingredient.id]},
+        ]
+
+        with self.assertNumQueries(8):
+            res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['title'] for r in res.data], ['Soup', 'Salad'])
+        self.assertEqual(res.data[0]['tags'], [tag.id])
+        self.assertEqual(res.data[1]['tags'], [])
+        recipes = models.Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 2)
+        self.assertEqual(
+            models.Recipe.ingredients.through.objects.filter(
+                recipe__in=recipes).count(), 2)
+
+    def test_bulk_create_reports_item_errors(self):
+        """Test nothing is created and errors are reported per item"""
+        user2 = get_user_model().objects.create_user(
+            'test2@gmail.com',
+            '1qazxsw2')
+        other_tag = sample_tag(user=user2)
+        payload = [
+            {'title': 'Soup', 'time_minutes': 20, 'price': '4.50'},
+            {'title': 'Salad', 'time_minutes': 'soon', 'price': '3.00'},
+            {'title': 'Stew', 'time_minutes': 90, 'price': '9.00',
+             'tags': [other_tag.id]},
+        ]
+
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('time_minutes', res.data[1])
+        self.assertEqual(res.data[2], {})
+        self.assertFalse(models.Recipe.objects.exists())
+
+        del payload[1]
+        res = self.client.post(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tags', res.data[1])
+        self.assertFalse(models.Recipe.objects.exists())
+
+
+class RecipeExportTests(TestCase):
+    """Test exporting recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'admin@gmail.com',
+            '1qazxsw2')
+        self.client.force_authenticate(self.user)
+
+    def test_export_ndjson(self):
+        """Test exporting recipes with their tag and ingredient names"""
+        recipe1 = sample_recipe(user=self.user, title='Soup')
+        recipe1.tags.add(sample_tag(user=self.user, name='Vegan'),
+                         sample_tag(user=self.user, name='Dinner'))
+        recipe1.ingredients.add(sample_ingredient(user=self.user))
+        recipe2 = sample_recipe(user=self.user, title='Salad')
+        sample_recipe(
+            user=get_user_model().objects.create_user('test2@gmail.com',
+                                                      '1qazxsw2')
+        )
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        recipes = [json.loads(line) for line in lines]
+        self.assertEqual([r['id'] for r in recipes], [recipe2.id, recipe1.id])
+        self.assertEqual(recipes[1]['tags'], ['Dinner', 'Vegan'])
+        self.assertEqual(recipes[1]['ingredients'], ['Cinnamon'])
+        self.assertEqual(recipes[1]['price'], '5.00')
+        self.assertEqual(recipes[0]['tags'], [])
+
+    def test_export_csv(self):
+        """Test exporting recipes as CSV"""
+        recipe = sample_recipe(user=self.user, title='Soup, hot')
+        recipe.tags.add(sample_tag(user=self.user, name='Vegan'),
+                        sample_tag(user=self.user, name='Dinner'))
+
+        res = self.client.get(EXPORT_URL, {'as': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        content = b''.join(res.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Soup, hot')
+        self.assertEqual(rows[0]['tags'], 'Dinner|Vegan')
+
+    def test_export_single_query(self):
+        """Test recipes and their names are read in one query"""
+        tag = sample_tag(user=self.user)
+        for i in range(5):
+            sample_recipe(user=self.user).tags.add(tag)
+
+        with patch.object(RecipeViewset, 'export_chunk_size', 2):
+            res = self.client.get(EXPORT_URL)
+            with self.assertNumQueries(1):
+                lines = list(res.streaming_content)
+
+        self.assertEqual(len(lines), 5)
+
+    def test_export_invalid_format(self):
+        """Test an unknown export format is rejected"""
+        res = self.client.get(EXPORT_URL, {'as': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeSearchTests(TestCase):
+    """Test searching recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'admin@gmail.com',
+            '1qazxsw2')
+        self.client.force_authenticate(self.user)
+
+    def _search(self, search, **params):
+        res = self.client.get(RECIPE_URL, {'search': search, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in res.data['results']]
+
+    def test_search_titles_tags_and_ingredients(self):
+        """Test searching matches titles and linked names, ranked"""
+        sample_recipe(user=self.user, title='Lemon tart')
+        curry = sample_recipe(user=self.user, title='Green curry')
+        curry.ingredients.add(sample_ingredient(user=self.user,
+                                                name='Lemons'))
+        salad = sample_recipe(user=self.user, title='Salad')
+        salad.tags.add(sample_tag(user=self.user, name='Lemony'))
+        sample_recipe(user=self.user, title='Roast beef')
+        sample_recipe(
+            user=get_user_model().objects.create_user('test2@gmail.com',
+                                                      '1qazxsw2'),
+            title='Lemon cake'
+        )
+
+        self.assertEqual(self._search('lemon'), ['Lemon tart', 'Green curry'])
+        self.assertEqual(self._search('lemony'), ['Salad'])
+        self.assertEqual(self._search('curries'), ['Green curry'])
+
+    def test_search_follows_renames_and_links(self):
+        """Test the search index follows tag renames and removed links"""
+        recipe = sample_recipe(user=self.user, title='Porridge')
+        tag = sample_tag(user=self.user, name='Breakfast')
+        recipe.tags.add(tag)
+        self.assertEqual(self._search('breakfast'), ['Porridge'])
+
+        tag.name = 'Brunch'
+        tag.save()
+        self.assertEqual(self._search('breakfast'), [])
+        self.assertEqual(self._search('brunch'), ['Porridge'])
+
+        recipe.tags.clear()
+        self.assertEqual(self._search('brunch'), [])
+
+        recipe.title = 'Oat brunch'
+        recipe.save()
+        self.assertEqual(self._search('brunch'), ['Oat brunch'])
+
+    def test_search_with_filters_and_pagination(self):
+        """Test search combines with the tag filter and pages"""
+        tag = sample_tag(user=self.user, name='Quick')
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Pasta {i}')
+            if i % 2:
+                recipe.tags.add(tag)
+
+        self.assertEqual(self._search('pasta', tags=tag.id),
+                         ['Pasta 3', 'Pasta 1'])
+
+        res = self.client.get(RECIPE_URL, {'search': 'pasta',
+                                           'page_size': 2})
+        titles = [recipe['title'] for recipe in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            titles += [recipe['title'] for recipe in res.data['results']]
+        self.assertEqual(titles, [f'Pasta {i}' for i in range(4, -1, -1)])
+
+
+class RecipeOrderingTests(TestCase):
+    """Test filtering recipes by ranges and sorting them"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'admin@gmail.com',
+            '1qazxsw2')
+        self.client.force_authenticate(self.user)
+
+    def _list_all(self, params):
+        """Return the recipe ids of every page, and of the pages walked
+        back through the previous links"""
+        res = self.client.get(RECIPE_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        pages = [[r['id'] for r in res.data['results']]]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            pages.append([r['id'] for r in res.data['results']])
+        back = []
+        while res.data['previous']:
+            res = self.client.get(res.data['previous'])
+            back.append([r['id'] for r in res.data['results']])
+        return pages, back
+
+    def test_filter_recipes_by_time_and_price(self):
+        """Test filtering recipes by maximum time and a price range"""
+        quick = sample_recipe(user=self.user, time_minutes=10, price=3)
+        sample_recipe(user=self.user, time_minutes=60, price=3)
+        sample_recipe(user=self.user, time_minutes=10, price=20)
+        sample_recipe(user=self.user, time_minutes=10, price=1)
+
+        res = self.client.get(RECIPE_URL, {
+            'max_time': 15, 'min_price': '2', 'max_price': '5.50',
+        })
+
+        self.assertEqual([r['id'] for r in res.data['results']], [quick.id])
+
+    def test_order_recipes_by_price_with_nulls(self):
+        """Test sorting by price pages in order, with unpriced last"""
+        prices = [4, None, 2, 4, None, 9, 2]
+        recipes = [sample_recipe(user=self.user, price=price)
+                   for price in prices]
+        ascending = [r.id for r in sorted(
+            recipes, key=lambda r: (r.price is None, r.price or 0, r.id)
+        )]
+
+        pages, back = self._list_all({'ordering': 'price', 'page_size': 2})
+        self.assertEqual(sum(pages, []), ascending)
+        self.assertEqual(back, pages[-2::-1])
+
+        pages, back = self._list_all({'ordering': '-price', 'page_size': 3})
+        self.assertEqual(sum(pages, []), ascending[::-1])
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_order_recipes_by_time_filtered(self):
+        """Test sorting by time combines with the range filters"""
+        times = [30, 5, 30, 15, 45]
+        recipes = [sample_recipe(user=self.user, time_minutes=minutes)
+                   for minutes in times]
+
+        pages, back = self._list_all({
+            'ordering': '-time_minutes', 'max_time': 30, 'page_size': 1,
+        })
+
+        self.assertEqual(sum(pages, []), [recipes[2].id, recipes[0].id,
+                                          recipes[3].id, recipes[1].id])
+
+    def test_order_and_range_invalid_params(self):
+        """Test unknown orderings and non numbers are rejected"""
+        for params in ({'ordering': 'title'}, {'ordering': '--price'},
+                       {'max_time': 'soon'}, {'min_price': 'NaN'}):
+            res = self.client.get(RECIPE_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(next(iter(params)), res.data)
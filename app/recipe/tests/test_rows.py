@@ -0,0 +1,66 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from core import models
+from recipe import serializers
+from recipe.rows import RowSerializer
+
+
+class RowSerializerTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'rows@gmail.com',
+            '1qazxsw2')
+        tags = [models.Tag.objects.create(user=self.user, name=name)
+                for name in ('Vegan', 'Dinner', 'Quick')]
+        ingredient = models.Ingredient.objects.create(user=self.user,
+                                                      name='Salt')
+        full = models.Recipe.objects.create(
+            user=self.user, title='Soup, "hot"', time_minutes=20,
+            price=Decimal('5.5'), link='https://example.com/soup',
+            image='uploads/recipe/ab/ab12.jpg',
+            image_variants={'thumbnail': 'uploads/recipe/ab/ab12-th.jpg'}
+        )
+        full.tags.add(*tags)
+        full.ingredients.add(ingredient)
+        models.Recipe.objects.create(user=self.user, title='Bare')
+        models.Recipe.objects.create(user=self.user, title='Empty',
+                                     image='', link='', price=0)
+        self.request = Request(APIRequestFactory().get('/'))
+        self.queryset = models.Recipe.objects.filter(user=self.user) \
+            .order_by('id')
+
+    def _render_both(self, fields=None):
+        serializer = serializers.RecipeSerializer(
+            context={'request': self.request}
+        )
+        many = serializers.RecipeSerializer(
+            self.queryset, many=True, context={'request': self.request}
+        )
+        if fields is not None:
+            for target in (serializer, many.child):
+                for name in set(target.fields) - set(fields):
+                    target.fields.pop(name)
+
+        rows = RowSerializer(serializer)
+        renderer = JSONRenderer()
+        return (renderer.render(many.data),
+                renderer.render(rows.serialize(rows.values(self.queryset))))
+
+    def test_rows_render_like_the_serializer(self):
+        """Test rows are rendered byte for byte like model instances"""
+        expected, rendered = self._render_both()
+
+        self.assertEqual(rendered, expected)
+        self.assertIn(b'"price":"5.50"', rendered)
+        self.assertIn(b'"image":"http://testserver/media/', rendered)
+
+    def test_rows_render_sparse_fields(self):
+        """Test a serializer without some fields reads only the rest"""
+        expected, rendered = self._render_both(fields=('id', 'tags'))
+
+        self.assertEqual(rendered, expected)
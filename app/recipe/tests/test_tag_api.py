@@ -1,13 +1,16 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.urls import reverse
 from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 from core import models
-from recipe import serializers
+from core.tests.utils import capture_on_commit_callbacks
+from recipe import cache, serializers
 
 
 TAGS_URL = reverse('recipe:tag-list')
+TAGS_BATCH_URL = reverse('recipe:tag-batch')
 
 
 def create_user(**params):
@@ -103,7 +106,7 @@ class PrivateTagsAPITests(TestCase):
         tag = models.Tag.objects.create(user=self.user,
                                         name='Breakfast')
         models.Tag.objects.create(user=self.user,
-                                  name='Breakfast')
+                                  name='Dinner')
         recipe1 = models.Recipe.objects.create(
             title='Pancakes',
             time_minutes=5,
@@ -120,3 +123,126 @@ class PrivateTagsAPITests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
         self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_tags_cached(self):
+        """Test the tag list is served from cache until a tag changes"""
+        models.Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL)
+        self.assertEqual(len(res.data), 1)
+
+        with capture_on_commit_callbacks(execute=True):
+            self.client.post(TAGS_URL, {'name': 'Dessert'})
+        res = self.client.get(TAGS_URL)
+        self.assertEqual([tag['name'] for tag in res.data],
+                         ['Vegan', 'Dessert'])
+
+        with capture_on_commit_callbacks(execute=True):
+            models.Tag.objects.filter(user=self.user, name='Vegan').delete()
+        res = self.client.get(TAGS_URL)
+        self.assertEqual([tag['name'] for tag in res.data], ['Dessert'])
+
+    def test_retrieve_tags_sparse_fields(self):
+        """Test fields= trims the cached tag list separately"""
+        tag = models.Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_URL, {'fields': 'id'})
+        self.assertEqual(res.data, [{'id': tag.id}])
+
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.data, [{'id': tag.id, 'name': 'Vegan'}])
+
+    def test_retrieve_tags_assigned_cache_invalidated(self):
+        """Test assigned tags are refreshed when recipe tags change"""
+        tag = models.Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = models.Recipe.objects.create(
+            title='Pancakes',
+            time_minutes=5,
+            price=3.00,
+            user=self.user)
+
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(len(res.data), 0)
+
+        with capture_on_commit_callbacks(execute=True):
+            recipe.tags.add(tag)
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(len(res.data), 1)
+
+        with capture_on_commit_callbacks(execute=True):
+            recipe.delete()
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(len(res.data), 0)
+
+    def test_versions_bumped_on_commit(self):
+        """Test the cached lists are invalidated once the write commits"""
+        tag_version = cache.get_version('tag', self.user.id)
+        recipe_version = cache.get_version('recipe', self.user.id)
+
+        with capture_on_commit_callbacks() as callbacks:
+            with transaction.atomic():
+                models.Tag.objects.create(user=self.user, name='Vegan')
+            self.assertEqual(cache.get_version('tag', self.user.id),
+                             tag_version)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get_version('tag', self.user.id),
+                            tag_version)
+        self.assertNotEqual(cache.get_version('recipe', self.user.id),
+                            recipe_version)
+
+    def test_retrieve_tags_not_modified(self):
+        """Test an unchanged tag list is answered with a 304"""
+        models.Tag.objects.create(user=self.user, name='Vegan')
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with capture_on_commit_callbacks(execute=True):
+            models.Tag.objects.create(user=self.user, name='Dessert')
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 2)
+
+    def test_create_tag_duplicate_name(self):
+        """Test creating a tag with a name the user already has fails"""
+        models.Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(models.Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_batch_get_or_create_tags(self):
+        """Test fetching tag ids by name creates only the missing tags"""
+        vegan = models.Tag.objects.create(user=self.user, name='Vegan')
+        user2 = get_user_model().objects.create_user('test2@gmail.com',
+                                                     'test1')
+        models.Tag.objects.create(user=user2, name='Dessert')
+        self.client.get(TAGS_URL)
+
+        payload = {'names': ['Dessert', 'Vegan', 'Dessert', 'Lunch']}
+        res = self.client.post(TAGS_BATCH_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([tag['name'] for tag in res.data],
+                         ['Dessert', 'Vegan', 'Lunch'])
+        self.assertEqual(res.data[1]['id'], vegan.id)
+        tags = models.Tag.objects.filter(user=self.user)
+        self.assertEqual(tags.count(), 3)
+        self.assertEqual({tag['id'] for tag in res.data},
+                         set(tags.values_list('id', flat=True)))
+
+        res = self.client.post(TAGS_BATCH_URL, payload, format='json')
+        self.assertEqual(tags.count(), 3)
+        self.assertEqual(len(self.client.get(TAGS_URL).data), 3)
+
+    def test_batch_tags_invalid(self):
+        """Test a batch without names is rejected"""
+        res = self.client.post(TAGS_BATCH_URL, {'names': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
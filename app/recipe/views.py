@@ -1,36 +1,93 @@
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from core import models
-from recipe import serializers
+from recipe import cache, export, filters, images, rows, serializers
+from recipe.mixins import ConditionalRequestMixin, SparseFieldsMixin
+from recipe.pagination import RecipeCursorPagination
+from users.authentication import CachedTokenAuthentication
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(ConditionalRequestMixin,
+                            SparseFieldsMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """Base viewset for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
+    def _assigned_only(self):
+        return bool(int(self.request.query_params.get('assigned_only', 0)))
+
+    def list(self, request, *args, **kwargs):
+        """Return the user's objs, cached until one of them changes"""
+        return self.conditional_response(self._cached_list, request,
+                                         *args, **kwargs)
+
+    def _cached_list(self, request, *args, **kwargs):
+        key = cache.list_key(self.get_version_scope(), request.user.id,
+                             int(self._assigned_only()),
+                             ','.join(self.get_sparse_fields() or ()))
+        data = cache.get_list(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set_list(key, data)
+        return Response(data)
+
     def get_queryset(self):
         """Return objs for the current auth user only"""
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-        )
         queryset = self.queryset
 
-        if assigned_only:
+        if self._assigned_only():
             queryset = queryset.filter(recipe__isnull=False)
 
-        return queryset.filter(
+        queryset = queryset.filter(
             user=self.request.user
         ).order_by('-name').distinct()
+        columns = self.get_sparse_columns()
+        if columns is not None:
+            queryset = queryset.only(*columns)
+        return queryset
 
     def perform_create(self, serializer):
         """Create a new obj for the current auth user"""
-        serializer.save(user=self.request.user)
+        try:
+            with transaction.atomic():
+                serializer.save(user=self.request.user)
+        except IntegrityError:
+            raise ValidationError({'name': ['This name already exists.']})
+
+    @action(methods=['POST'], detail=False, url_path='batch')
+    def batch(self, request):
+        """Return the objs with the given names, creating missing ones"""
+        serializer = serializers.AttrBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = self.queryset.model.objects.bulk_get_or_create(
+            request.user, serializer.validated_data['names']
+        )
+        if any(created for obj, created in results):
+            # The raw insert sends no signals to invalidate the list
+            cache.bump_version(self.get_version_scope(), request.user.id)
+
+        objs = [obj for obj, created in results]
+        return Response(
+            self.get_serializer(objs, many=True).data,
+            status=status.HTTP_200_OK
+        )
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -45,42 +102,213 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     serializer_class = serializers.IngredientSerializer
 
 
-class RecipeViewset(viewsets.ModelViewSet):
+class RecipeViewset(ConditionalRequestMixin, SparseFieldsMixin,
+                    viewsets.ModelViewSet):
     """Manage recipes in the database"""
     serializer_class = serializers.RecipeSerializer
-    queryset = models.Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    queryset = models.Recipe.objects.defer('search_vector')
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeCursorPagination
+    # Each has a (user, field, id) index to read sorted pages from
+    ordering_fields = ('id', 'time_minutes', 'price')
+    range_filters = (
+        ('max_time', 'time_minutes__lte', int),
+        ('min_price', 'price__gte', Decimal),
+        ('max_price', 'price__lte', Decimal),
+    )
+    export_chunk_size = 1000
 
     def get_serializer_class(self):
         """Return a appropriate serializer class"""
         if self.action == 'retrieve':
             return serializers.RecipeDetailSerializer
-        elif self.action == 'upload-image':
+        elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'bulk_create':
+            return serializers.RecipeBulkSerializer
         return self.serializer_class
 
-    def _params_to_its(self, qs):
-        """Convert list of str to a list of int"""
-        return [int(str_id) for str_id in qs.split(',')]
+    def list(self, request, *args, **kwargs):
+        """List the user's recipes, honouring conditional requests"""
+        return self.conditional_response(self._list_rows, request,
+                                         *args, **kwargs)
+
+    def _list_rows(self, request, *args, **kwargs):
+        """List recipes rendered from values() rows, as the serializer would
+
+        No model instances or per-field serializer calls are made, and
+        the tag and ingredient ids come with the recipes in one query.
+        """
+        serializer = rows.RowSerializer(self.get_serializer())
+        queryset = self.get_rows_queryset(serializer)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(queryset))
+
+    def get_rows_queryset(self, serializer):
+        """Return the listed recipes as the rows a RowSerializer reads"""
+        return serializer.values(
+            self.filter_queryset(self.get_queryset()),
+            *(field.lstrip('-') for field in self.get_ordering())
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Retrieve a recipe, honouring conditional requests
+
+        The recipe is looked up first, so a missing or foreign one is a
+        404 rather than a 304.
+        """
+        instance = self.get_object()
+        return self.conditional_response(
+            lambda request, *args, **kwargs: Response(
+                self.get_serializer(instance).data
+            ),
+            request, *args, **kwargs
+        )
+
+    def get_ordering(self):
+        """Return the order recipes are listed and paginated in"""
+        params = self.request.query_params
+        ordering = params.get('ordering')
+        if not ordering:
+            return ('-rank', '-id') if params.get('search') else ('-id',)
+
+        field = ordering.lstrip('-')
+        if ordering.count('-') > 1 or field not in self.ordering_fields:
+            raise ValidationError({'ordering': [
+                f'Choose one of {", ".join(self.ordering_fields)}, '
+                f'prefixed with - for descending order.'
+            ]})
+        if field == 'id':
+            return (ordering,)
+        # Ties are broken by id in the same direction, following the index
+        return (ordering, '-id' if ordering.startswith('-') else 'id')
 
     def get_queryset(self):
         """Retrive the recipes for the authenticate user"""
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('search')
         queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_its(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredient_ids = self._params_to_its(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-        return queryset.filter(user=self.request.user).order_by('-id')
-        # return self.queryset.filter(user=self.request.user).order_by('-id')
+        if search:
+            # Must use the configuration the search_vector triggers use
+            query = SearchQuery(search, config='english')
+            # ts_rank() returns a real, read it as a double precision so
+            # the rank in the pagination cursor compares equal to itself
+            queryset = queryset.filter(search_vector=query).annotate(
+                rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+            )
+        queryset = self._filter_related(queryset)
+        for param, lookup, convert in self.range_filters:
+            if self.request.query_params.get(param):
+                queryset = queryset.filter(**{lookup: filters.parse_number(
+                    param, self.request.query_params[param], convert
+                )})
+        ordering = self.get_ordering()
+        queryset = queryset.filter(user=self.request.user) \
+            .order_by(*ordering)
+        # The paginator reads the ordering values of the page edges
+        columns = self.get_sparse_columns(
+            *(field.lstrip('-') for field in ordering)
+        )
+        if columns is not None:
+            queryset = queryset.only(*columns)
+        return self._prefetch_for_action(queryset, self.action,
+                                         self.get_sparse_fields())
+
+    def _filter_related(self, queryset):
+        """Filter by tag and ingredient ids (?tags=1,2&match=all)"""
+        params = self.request.query_params
+        match = filters.parse_match(params.get('match'))
+        for field in ('tags', 'ingredients'):
+            if params.get(field):
+                ids = filters.parse_ids(field, params[field])
+                queryset = filters.filter_related(queryset, field, ids, match)
+        return queryset
+
+    def _prefetch_for_action(self, queryset, action_name, fields=None):
+        """Prefetch the relations read by the action's serializer
+
+        Every action then runs a fixed number of queries, one for the
+        recipes and one per prefetched relation, however many recipes
+        the user has. Relations left out of the fields aren't fetched.
+        Lists are read as rows, their related ids come with the recipes.
+        """
+        if action_name == 'retrieve':
+            return queryset.prefetch_related(*(
+                name for name in ('tags', 'ingredients')
+                if fields is None or name in fields
+            ))
+        return queryset
 
     def perform_create(self, serializer):
         """Create a new obj for the current auth user"""
-        serializer.save(user=self.request.user)
+        self._save_image(serializer, user=self.request.user)
+
+    def perform_update(self, serializer):
+        self._save_image(serializer)
+
+    @transaction.atomic
+    def _save_image(self, serializer, **kwargs):
+        """Save a recipe, resizing its image after the response if new
+
+        The image file and the recipe referencing it are saved in one
+        transaction, see core.storage.lock_name().
+        """
+        if 'image' not in serializer.validated_data:
+            return serializer.save(**kwargs)
+
+        old = serializer.instance
+        if old is not None and old.image:
+            name, variants = old.image.name, old.image_variants
+        else:
+            name = variants = None
+        recipe = serializer.save(image_variants=None, **kwargs)
+        if name and name != recipe.image.name:
+            transaction.on_commit(
+                lambda: images.release_image(name, variants)
+            )
+        images.schedule_variants(recipe)
+        return recipe
+
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk_create(self, request):
+        """Create a list of recipes in one transaction"""
+        serializer = self.get_serializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        recipes = serializer.save(user=request.user)
+
+        created = rows.RowSerializer(serializers.RecipeSerializer(
+            context=self.get_serializer_context()
+        ))
+        queryset = models.Recipe.objects.filter(
+            id__in=[recipe.id for recipe in recipes]
+        ).order_by('id')
+        return Response(created.serialize(created.values(queryset)),
+                        status=status.HTTP_201_CREATED)
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """Stream the user's recipes as NDJSON or CSV (?as=csv)"""
+        output = request.query_params.get('as', 'ndjson')
+        if output not in export.FORMATS:
+            return Response(
+                {'as': [f'Choose one of {", ".join(export.FORMATS)}.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        lines, content_type = export.FORMATS[output]
+        recipes = export.iter_recipes(self.get_queryset(), request,
+                                      self.export_chunk_size)
+        response = StreamingHttpResponse(lines(recipes),
+                                         content_type=content_type)
+        response['Content-Disposition'] = \
+            f'attachment; filename="recipes.{output}"'
+        return response
 
     @action(methods=['PATCH'], detail=True, url_path='upload-image')
     def upload_image(self, request, pk=None):
@@ -89,7 +317,7 @@ class RecipeViewset(viewsets.ModelViewSet):
         serializer = self.get_serializer(recipe,
                                          data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            self.perform_update(serializer)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
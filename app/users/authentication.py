@@ -0,0 +1,59 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.authentication import TokenAuthentication
+from core.timing import timed
+
+
+def _cache():
+    """Return the token cache, None if the workers don't share it
+
+    Evicting from a per-process cache only reaches the worker that
+    handled the change, the others would keep accepting a revoked token
+    until it expires.
+    """
+    cache = caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+    if isinstance(cache, LocMemCache) and not settings.AUTH_TOKEN_CACHE_LOCAL:
+        return None
+    return cache
+
+
+def token_cache_key(key):
+    """Return the cache key of a token without exposing the token itself"""
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def evict_tokens(*keys):
+    """Drop cached lookups so revoked tokens stop working immediately"""
+    cache = _cache()
+    if cache is not None:
+        cache.delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that caches the token to user lookup
+
+    Entries live for AUTH_TOKEN_CACHE_TIMEOUT seconds and are evicted as
+    soon as the token is deleted or its user is saved. The cache set by
+    AUTH_TOKEN_CACHE_ALIAS has to be shared by the worker processes, e.g.
+    memcached or redis, for eviction to reach every worker. Lookups
+    aren't cached in a local memory cache unless AUTH_TOKEN_CACHE_LOCAL
+    says there is a single worker.
+    """
+
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        cache = _cache()
+        if cache is None:
+            return super().authenticate_credentials(key)
+        cache_key = token_cache_key(key)
+        credentials = cache.get(cache_key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(cache_key, credentials,
+                      settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        return credentials
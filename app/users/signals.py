@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from users.authentication import evict_tokens
+
+
+# Evicting before the commit would let a concurrent request cache the
+# lookup it still sees, so the tokens are evicted once the change commits
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    """Revoke a deleted token"""
+    key = instance.key
+    transaction.on_commit(lambda: evict_tokens(key))
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_user_tokens(sender, instance, created, **kwargs):
+    """Refresh the cached user, revoking access once it is deactivated"""
+    if not created:
+        keys = list(Token.objects.filter(user=instance)
+                    .values_list('key', flat=True))
+        transaction.on_commit(lambda: evict_tokens(*keys))
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from core.tests.utils import capture_on_commit_callbacks
+from users.authentication import token_cache_key
+
+
+ME_URL = reverse('user:me')
+
+
+@override_settings(AUTH_TOKEN_CACHE_LOCAL=True)
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating with cached tokens"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@gmail.com',
+            password='1qazxsw2',
+            name='Test name'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_cached(self):
+        """Test the token is only looked up in the database once"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    @override_settings(AUTH_TOKEN_CACHE_LOCAL=False)
+    def test_local_cache_not_used(self):
+        """Test tokens aren't cached in a cache the workers don't share"""
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_deleted_token_rejected(self):
+        """Test a deleted token stops working immediately"""
+        self.client.get(ME_URL)
+        with capture_on_commit_callbacks(execute=True):
+            self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_inactive_user_rejected(self):
+        """Test deactivating a user revokes their cached token"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        with capture_on_commit_callbacks(execute=True):
+            self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_evicted_on_commit(self):
+        """Test the cached lookup is evicted once the delete commits"""
+        self.client.get(ME_URL)
+        cache_key = token_cache_key(self.token.key)
+
+        with capture_on_commit_callbacks() as callbacks:
+            self.token.delete()
+            self.assertIsNotNone(cache.get(cache_key))
+
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(cache_key))
+
+    def test_invalid_token_rejected(self):
+        """Test an unknown token is rejected"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)